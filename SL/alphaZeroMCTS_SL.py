@@ -1,8 +1,9 @@
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
-import copy
 import numpy as np
 from random import choice
+from searchBudget import searchBudget
+from transpositionTable import transpositionTable
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 class alphaZeroMCTS:
@@ -12,26 +13,44 @@ class alphaZeroMCTS:
         a : used for a move
      """
     def __init__(self,board, network, *kargs, **kwds):
-        self._N_sa = {}
-        self._W_sa = {}
-        self._L_sa = {}
+        # statistics tables, at most maxEntries keys or about maxBytes bytes
+        # if given, evicting the least recent or least visited keys first
+        self._table = transpositionTable(('N', 'W', 'L'),
+                                         kwds.get('maxEntries'),
+                                         kwds.get('maxBytes'),
+                                         kwds.get('evict', 'recent'))
+        self._N_sa = self._table.table('N')
+        self._W_sa = self._table.table('W')
+        self._L_sa = self._table.table('L')
         self._board = board
         self._network = network
         self._maxMoves = 100
         self._maxGameSim =1000
         self._ucbK = 1.4
+        # optional tttSolver, when given moves are labelled from its tablebase
+        # instead of running simulations
+        self._tablebase = kwds.get('tablebase')
+        # searchBudget limiting every search, by default _maxGameSim
+        # simulations
+        self._budget = kwds.get('budget')
+        if self._budget is None:
+            self._budget = searchBudget(simulations=self._maxGameSim)
+        # scratch board the simulations play on and roll back
+        self._simulationBoard = board.clone()
 
     def runSimulation(self):
         """ runs a monte carlo tree search simulation and updates search
             statistics
         """
         visitedActions = set()
-        # should run this simulation on a copy so as not to corrupt the actual
-        # board by making moves on it
-        simulationBoard = copy.deepcopy(self._board)
+        # moves are made on the scratch board so as not to corrupt the actual
+        # board, and taken back once the simulation is over
+        simulationBoard = self._simulationBoard
         simBoardState = simulationBoard.getState()
+        movesMade = 0
         expandNode = True
         W,N = self._W_sa,self._N_sa
+        self._table.tick()
 
         for t in range(self._maxMoves):
             legalMoves = simulationBoard.legalMoves()
@@ -50,20 +69,27 @@ class alphaZeroMCTS:
 
             Pi = [0]*self._board._boardSize
             Pi[move] = 1
-            if expandNode and (simBoardState,move) not in self._N_sa:
-                expandNode = False
-                self._N_sa[(simBoardState,move)] = 0
-                self._W_sa[(simBoardState,move)] = 0
-                self._L_sa[(simBoardState,move)] = 0
+            if expandNode:
+                # touched on the way down, so that adding the leaf cannot
+                # evict the path
+                if self._table.lookup((simBoardState,move)):
+                    self._table.touch((simBoardState,move))
+                else:
+                    expandNode = False
+                    self._table.add((simBoardState,move), 0, 0, 0)
                 
             visitedActions.add((simBoardState, move))            
             simulationBoard.makeMove(move)
+            movesMade += 1
             simBoardState  = simulationBoard.getState()
             winner = simulationBoard.winner()
             loser = simulationBoard.opponent(winner)
             if winner:
                 break
 
+        for t in range(movesMade):
+            simulationBoard.unmakeMove()
+
         for simBoardState, move in visitedActions:
             currPlayer = self._board.stateToPlayer(simBoardState)
             if (simBoardState,move) not in self._N_sa:
@@ -82,14 +108,26 @@ class alphaZeroMCTS:
         """
         legalMoves = self._board.legalMoves()
         boardState = self._board.getState()
+        if self._tablebase is not None:
+            pi = [0]*self._board._boardSize
+            pi[self._tablebase.bestMove(self._board)] = 1
+            return pi
         # no need to run simulation if there are no real choices
         # so return accordingly
         games = 0
-        while games < self._maxGameSim:
+        self._simulationBoard = self._board.clone()
+        rootVisits = lambda: [self._N_sa.get((boardState,a),0) for a in legalMoves]
+        self._table.pin((boardState,a) for a in legalMoves)
+        self._budget.start()
+        while self._budget.running(len(self._N_sa), rootVisits):
             self.runSimulation()
             games+=1
-        prob, move = max( ( ( (self._W_sa[(boardState,a)]-self._L_sa[(boardState,a)])
-                        /self._N_sa[(boardState,a)]), a) for a in legalMoves)
+        if self._budget.stopsEarly():
+            # an early stop only guarantees the most visited move stays on top
+            visits, move = max((self._N_sa[(boardState,a)], a) for a in legalMoves)
+        else:
+            prob, move = max( ( ( (self._W_sa[(boardState,a)]-self._L_sa[(boardState,a)])
+                            /self._N_sa[(boardState,a)]), a) for a in legalMoves)
         pi = [0]*9
         pi[move] = 1
         return pi
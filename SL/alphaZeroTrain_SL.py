@@ -1,5 +1,6 @@
 from alphaZeroMCTS_SL import alphaZeroMCTS
 from tttBoard import tttBoard
+from tttSolver import tttSolver
 #from convNeuralNetwork import cnNetwork
 from deepNeuralNetwork_SL import dnNetwork
 import numpy as np
@@ -7,74 +8,47 @@ import numpy as np
 board1DSize = 3
 gamesTrainBatch = 10
 totalBatches =1
+# label moves with the perfect play tablebase instead of search
+useTablebase = False
 #brain = cnNetwork(inputShape=(board1DSize,board1DSize,7),
 #                  outputSize=board1DSize*board1DSize+1)
 board = tttBoard(3)
 brain = dnNetwork(2*board1DSize*board1DSize+1,board1DSize*board1DSize+1)
-def gameOver(board):
-    if (board.winner()):
-        if(board.winner()==1):
-            return 1
-        elif(board.winner()==2):
-            return 1
-        elif(board.winner()==-1):
-            return 1
-    else:
-        return 0
-
+tablebase = tttSolver(board1DSize) if useTablebase else None
 def playGame(brain,TotalGames):
-    games = 0
-    allStates = []
+    # games are played one after the other, the finished ones only keep their
+    # played states, labels and result
+    playedStates = []
     allPiLabels = []
     allZLabels = []
-    while games < TotalGames:
-        print(games)
+    for game in range(TotalGames):
+        print(game)
         playedMoves = {}
         board = tttBoard(board1DSize)
-        nMoves = 0
-#        brain.loadModel()
-        while len(board.legalMoves()) > 0:
+        while not board.winner():
             state = board.getState()
 #            print("state ",state)
-            alphaZeroTTT = alphaZeroMCTS(board,brain)
+            alphaZeroTTT = alphaZeroMCTS(board,brain,tablebase=tablebase)
             pi = alphaZeroTTT.getMCTSMoveProbs()
             playedMoves[state] = pi
 #            print("pi ", pi)
             board.makeMove(np.argmax(pi))
 #            print("move ",np.argmax(pi))
 #            board.display()
-            nMoves += 1
-            if gameOver(board):
-                games += 1
-                winner = board.winner()
-                if winner == 1:     # O is winner
-                    z = 1
-                elif winner == -1:  # draw
-                    z = 0
-                else:               # X is winner
-                    assert(winner == 2)
-                    z = -1
-                break
-        ind = 0
-        piLabel = np.zeros((board1DSize*board1DSize,nMoves))
-        ZLabel = np.zeros((1,nMoves))
-        states = np.zeros((2*board1DSize*board1DSize+1,nMoves))
-#        statesCNN = np.zeros((nMoves,board1DSize,board1DSize,7))
+        # O is winner: 1, X is winner: -1, draw: 0
+        winner = board.winner()
+        z = 1 if winner == 1 else -1 if winner == 2 else 0
         for state in playedMoves:
-            pi = playedMoves[state]
-            #define the training data structure here,           
-#            statesCNN[ind] = np.float32(board.decodeStateCNN(board._stateHistory))
-            states[:,ind] = board.decodeState(state)
-            piLabel[:,ind] = pi
-            ZLabel[:,ind] = z
-            ind+=1
-        
-        allStates.append(states)
-        allPiLabels.append(piLabel)
-        allZLabels.append(ZLabel)
-    allStates = np.concatenate(allStates,axis=1)
-    allPiLabels = np.concatenate(allPiLabels,axis=1)
-    allZLabels = np.concatenate(allZLabels,axis=1)
+            playedStates.append(state)
+            allPiLabels.append(playedMoves[state])
+            allZLabels.append(z)
+    #define the training data structure here, one column per played state
+#    statesCNN = board.decodeStatesCNN(playedHistories)
+    allStates = np.zeros((len(playedStates),2*board1DSize*board1DSize+1),dtype=np.float32)
+    board.decodeStates(playedStates,out=allStates)
+    allStates = allStates.T
+    allPiLabels = np.array(allPiLabels).T
+    allZLabels = np.array(allZLabels).reshape(1,-1)
     return allStates, allPiLabels, allZLabels
         
 for ii in range(totalBatches):
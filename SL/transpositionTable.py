@@ -0,0 +1,143 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+from __future__ import division
+import sys
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+class transpositionTable:
+    """ statistics tables of a search sharing one set of keys, such as the
+        plays, wins and losses of monteCarlo, held to at most maxEntries keys
+        or about maxBytes bytes. The first table holds the visit counts.
+        Once the cap is passed whole nodes are evicted till keep of the cap
+        is left, the nodes visited least recently with evict='recent' or the
+        ones with the fewest visits with evict='visits'. nodeOf maps a key to
+        its node, so that all the moves of a position go together. Pinned
+        nodes and nodes added or touched in the current simulation stay
+    """
+    # bytes of a dictionary slot, hash key and value pointers and spare room
+    slotBytes = 40
+
+    def __init__(self, names, maxEntries=None, maxBytes=None, evict='recent',
+                 nodeOf=None, keep=0.9):
+        assert(evict in ('recent', 'visits'))
+        self._names = tuple(names)
+        self._tables = tuple({} for name in self._names)
+        self._visits = self._tables[0]
+        # simulation count when each key was last added or touched
+        self._lastVisit = {}
+        self._clock = 0
+        self._maxEntries = maxEntries
+        self._maxBytes = maxBytes
+        self._evict = evict
+        self._nodeOf = nodeOf
+        self._keep = keep
+        self._pinned = set()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def table(self, name):
+        """ returns the dictionary of table name, the same one for the life
+            of the transposition table
+        """
+        return self._tables[self._names.index(name)]
+
+    def __len__(self):
+        return len(self._visits)
+
+    def tick(self):
+        """ starts a new simulation """
+        self._clock += 1
+
+    def touch(self, key):
+        """ marks key as visited in the current simulation. Searchers touch
+            the keys of their path on the way down, before the leaf is added
+        """
+        self._lastVisit[key] = self._clock
+
+    def pin(self, nodes):
+        """ keeps nodes, such as the ones of the root moves, from eviction
+            till the next call
+        """
+        self._pinned = set(nodes)
+
+    def lookup(self, key):
+        """ returns True if key is in the tables, counting a hit, otherwise
+            counts a miss
+        """
+        if key in self._visits:
+            self._hits += 1
+            return True
+        self._misses += 1
+        return False
+
+    def add(self, key, *values):
+        """ puts values of key in the tables, in the order of their names, and
+            evicts nodes if the cap is passed
+        """
+        for table, value in zip(self._tables, values):
+            table[key] = value
+        self._lastVisit[key] = self._clock
+        if self._maxEntries is None and self._maxBytes is not None:
+            self._maxEntries = max(1, self._maxBytes // self.entryBytes(key))
+        if self._maxEntries is not None and len(self._visits) > self._maxEntries:
+            self.evict()
+
+    def entryBytes(self, key):
+        """ returns estimate of the bytes taken by a key like key in all the
+            tables together
+        """
+        size = sum(sys.getsizeof(part) for part in key) if isinstance(key, tuple) else 0
+        for table in self._tables + (self._lastVisit,):
+            size += transpositionTable.slotBytes + sys.getsizeof(key)
+            size += sys.getsizeof(table.get(key, 0))
+        return size
+
+    def evict(self):
+        """ removes nodes, least recently visited or least visited first,
+            till keep of maxEntries keys are left
+        """
+        nodeOf = self._nodeOf
+        byRecent = self._evict == 'recent'
+        priority = {}
+        members = {}
+        current = set()
+        for key, stamp in self._lastVisit.items():
+            node = key if nodeOf is None else nodeOf(key)
+            value = stamp if byRecent else self._visits.get(key, 0)
+            if node in priority:
+                priority[node] = max(priority[node], value) if byRecent else priority[node] + value
+                members[node].append(key)
+            else:
+                priority[node] = value
+                members[node] = [key]
+            if stamp == self._clock:
+                # never evict what the running simulation is using
+                current.add(node)
+        target = int(self._keep * self._maxEntries)
+        for node in sorted(priority, key=priority.get):
+            if len(self._visits) <= target:
+                break
+            if node in self._pinned or node in current:
+                continue
+            for key in members[node]:
+                for table in self._tables:
+                    table.pop(key, None)
+                del self._lastVisit[key]
+                self._evictions += 1
+
+    def stats(self):
+        """ returns dictionary of entries, estimated bytes, hits, misses and
+            evicted keys
+        """
+        size = self.entryBytes(next(iter(self._visits))) * len(self) if len(self) else 0
+        return {'entries': len(self), 'bytes': size, 'hits': self._hits,
+                'misses': self._misses, 'evictions': self._evictions}
+
+    def report(self):
+        """ returns stats as a line of text """
+        stats = self.stats()
+        lookups = max(stats['hits'] + stats['misses'], 1)
+        return ("Table: {entries} entries, {0:.1f} MB, {hits} hits ({1:.0f}%), "
+                "{misses} misses, {evictions} evictions").format(
+                    stats['bytes'] / 2**20, 100*stats['hits'] / lookups, **stats)
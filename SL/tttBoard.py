@@ -3,28 +3,216 @@
 #0 1
 #2 3  
 #Player O is 1 and Player X is 2
-#history of moves is stored in a list as 'O2','X0' etc.
-#the state will be a nxn string made by joining the list
+#history of moves is stored in a preallocated array of squares, with a ply
+#counter. O makes the even plies and X the odd ones
+#the state will be a nxn string of 0,1 and 2, one character per square
+#internally the board is two bitboards, one per player, with bit i set when
+#square i is occupied by that player
+from array import array
+from bisect import insort
+from operator import itemgetter
+from random import Random, shuffle
 import numpy as np
 class tttBoard:
 
+    #masks of all winning lines, computed once per (rows,n,k) and shared by
+    #every board of that size
+    _winLinesCache = {}
+    #square permutations of the 8 symmetries of the board, computed once per n
+    _symmetriesCache = {}
+    #random 64 bit numbers for zobrist hashing, one per player and square
+    _zobristCache = {}
+
     # Initialize the board, needs n to create nxn board
-    def __init__(self, n):
-        #board is a size nxn list containing 0,1 or 2 depending upon whether 
-        #it is empty, O or X respectively
-        self._board = [0]*n*n
-        self._state = "".join([str(p) for p in self._board])
-        #history contains the list of all moves
-        self._stateHistory = []
-        self._moveHistory = []
-        self._boardSize = n*n
+    # k is the number of marks in a row needed to win, full row by default
+    # rows gives the number of rows of a rectangular board, n by default
+    def __init__(self, n, k=None, rows=None):
+        #_Oboard and _Xboard are n*n bit integers with 1 at the squares
+        #occupied by O and X respectively. _occupied is their union, cached
+        #so that emptiness of a square is a single and
+        rows = n if rows is None else rows
+        size = rows*n
+        self._Oboard = 0
+        self._Xboard = 0
+        self._occupied = 0
+        self._fullBoard = (1 << size) - 1
+        #state string and list of empty squares are updated incrementally by
+        #makeMove instead of being rebuilt on every call
+        self._state = "0"*size
+        self._legalMoves = list(range(size))
+        #history contains the list of all moves, square of ply i at _moves[i]
+        #squares fit in signed bytes up to 11x11, shorts above that
+        self._moves = array('b' if size <= 127 else 'h', [0]*size)
+        self._ply = 0
+        self._rows = rows
+        self._boardSize = size
         self._1Dsize = n
+        self._k = n if k is None else k
+        self._winLines, self._cellLines = tttBoard.winLines(n, self._k, rows=rows)
+        #the 8 symmetries only hold on square boards, rectangular boards are
+        #their own canonical form
+        self._symmetries = tttBoard.symmetries(n) if rows == n else None
+        #zobrist hash of the position, xor of the numbers of occupied squares
+        self._zobrist = tttBoard.zobristTable(size)
+        self._hash = 0
     
-    def decodeState(self,s):
-        state = np.zeros((1,self._boardSize))
-        for i in range(self._boardSize):
-            state[0,i] = s[i]
-        return state
+    @classmethod
+    def winLines(cls, n, k=None, rows=None):
+        """ returns a tuple (lines, cellLines) for nxn board with k in a row
+            lines is the bitmask of every row, column and diagonal segment
+            of length k. cellLines[i] holds only the lines through square i
+            rows gives the number of rows of a rectangular board, n by default
+        """
+        if k is None:
+            k = n
+        if rows is None:
+            rows = n
+        if (rows, n, k) not in cls._winLinesCache:
+            lines = []
+            for row in range(rows):
+                for col in range(n):
+                    # right, down, down-right and down-left from (row,col)
+                    for dRow, dCol in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                        endRow = row + (k-1)*dRow
+                        endCol = col + (k-1)*dCol
+                        if endRow >= rows or endCol < 0 or endCol >= n:
+                            continue
+                        line = 0
+                        for jj in range(k):
+                            line |= 1 << ((row + jj*dRow)*n + col + jj*dCol)
+                        lines.append(line)
+            cellLines = tuple(tuple(line for line in lines if (line >> ii) & 1)
+                              for ii in range(rows*n))
+            cls._winLinesCache[(rows, n, k)] = (tuple(lines), cellLines)
+        return cls._winLinesCache[(rows, n, k)]
+
+    @classmethod
+    def zobristTable(cls, boardSize):
+        """ returns a tuple of two tuples of random 64 bit numbers, for O and
+            X on each square. The generator is seeded with boardSize so keys
+            are the same in every process
+        """
+        if boardSize not in cls._zobristCache:
+            rng = Random(boardSize)
+            cls._zobristCache[boardSize] = tuple(
+                tuple(rng.getrandbits(64) for ii in range(boardSize))
+                for player in (1, 2))
+        return cls._zobristCache[boardSize]
+
+    def key(self):
+        """ returns the zobrist hash of the position, an integer which is
+            updated with every move instead of being built like getState
+        """
+        return self._hash
+
+    def keyAfterMove(self, move):
+        """ returns the zobrist hash of the position after move is played """
+        return self._hash ^ self._zobrist[self.currPlayer()-1][move]
+
+    @classmethod
+    def symmetries(cls, n):
+        """ returns a tuple (perms, inversePerms, gathers) describing the 8
+            rotations and reflections of nxn board. Symmetry t moves square i
+            to square perms[t][i] and inversePerms[t] undoes it.
+            gathers[t](state) returns the characters of the transformed state
+            Symmetry 0 is the identity
+        """
+        if n not in cls._symmetriesCache:
+            perms = []
+            for transpose in (False, True):
+                for flipRow in (False, True):
+                    for flipCol in (False, True):
+                        perm = []
+                        for ii in range(n*n):
+                            row, col = divmod(ii, n)
+                            if transpose:
+                                row, col = col, row
+                            if flipRow:
+                                row = n - 1 - row
+                            if flipCol:
+                                col = n - 1 - col
+                            perm.append(row*n + col)
+                        perms.append(tuple(perm))
+            inversePerms = []
+            for perm in perms:
+                inverse = [0]*(n*n)
+                for ii in range(n*n):
+                    inverse[perm[ii]] = ii
+                inversePerms.append(tuple(inverse))
+            gathers = tuple(itemgetter(*inverse) for inverse in inversePerms)
+            cls._symmetriesCache[n] = (tuple(perms), tuple(inversePerms), gathers)
+        return cls._symmetriesCache[n]
+
+    def canonicalize(self, state=None):
+        """ returns (canonicalState, transform) for the passed state, by
+            default the current one. canonicalState is the smallest of the 8
+            symmetric copies of state and is the same for all of them.
+            transform is the symmetry taking state to canonicalState, use
+            toCanonicalMove/fromCanonicalMove to remap moves between frames
+        """
+        if state is None:
+            state = self._state
+        if self._boardSize == 1 or self._symmetries is None:
+            return state, 0
+        gathers = self._symmetries[2]
+        canonicalState, transform = state, 0
+        for t in range(1, 8):
+            symState = "".join(gathers[t](state))
+            if symState < canonicalState:
+                canonicalState, transform = symState, t
+        return canonicalState, transform
+
+    def toCanonicalMove(self, move, transform):
+        """ maps move on the actual board to the canonical board """
+        if self._symmetries is None:
+            return move
+        return self._symmetries[0][transform][move]
+
+    def fromCanonicalMove(self, move, transform):
+        """ maps move on the canonical board back to the actual board """
+        if self._symmetries is None:
+            return move
+        return self._symmetries[1][transform][move]
+
+    def unpackStates(self, states):
+        """ takes a sequence of B states and returns a (B, boardSize) uint8
+            array holding 0, 1 or 2 for every square
+        """
+        packed = np.frombuffer("".join(states).encode(), dtype=np.uint8)
+        return packed.reshape(len(states), self._boardSize) - ord('0')
+
+    def unpackBitboards(self, bitboards):
+        """ takes a sequence of B bitboards and returns a (B, boardSize) uint8
+            array with 1 at the squares whose bit is set
+        """
+        numBytes = (self._boardSize + 7) // 8
+        packed = np.frombuffer(b"".join(int(b).to_bytes(numBytes, 'little')
+                                        for b in bitboards), dtype=np.uint8)
+        return np.unpackbits(packed.reshape(len(bitboards), numBytes), axis=1,
+                             bitorder='little')[:, :self._boardSize]
+
+    def decodeStates(self, states, out=None):
+        """ batch version of decodeState. Takes a sequence of B states and
+            writes their encodings to the rows of out, a float32 array of
+            shape (B, 2*boardSize + 1) which is allocated if not passed
+        """
+        return self.decodeSquares(self.unpackStates(states), out)
+
+    def decodeBitboards(self, Oboards, Xboards, out=None):
+        """ same as decodeStates, for positions given as O and X bitboards """
+        squares = self.unpackBitboards(Oboards) + 2*self.unpackBitboards(Xboards)
+        return self.decodeSquares(squares, out)
+
+    def decodeSquares(self, squares, out=None):
+        """ writes encoding of (B, boardSize) array of 0, 1 and 2 to out """
+        if out is None:
+            out = np.zeros((len(squares), 2*self._boardSize + 1), dtype=np.float32)
+        size = self._boardSize
+        np.equal(squares, 1, out=out[:, :size], casting='unsafe')
+        np.equal(squares, 2, out=out[:, size:2*size], casting='unsafe')
+        # every even's turn is O's move
+        out[:, -1] = 1 + np.count_nonzero(squares, axis=1) % 2
+        return out
 
     def decodeState(self, s):
         """ takes state list of array boardSize and returns
@@ -33,22 +221,34 @@ class tttBoard:
             second boardSize represent X's position
             last element is player to make next move
         """
-        state = np.float32(np.zeros((2 * self._boardSize + 1)))
-        numOccupiedSq = 0;
-        for i in range(self._boardSize):
-            if s[i] == '1':
-                state[i] = 1
-                numOccupiedSq += 1;
-            elif s[i] == '2':
-                state[self._boardSize+i] = 1
-                numOccupiedSq += 1;
-        # every even's turn is O's move
-        if numOccupiedSq % 2 == 0:
-            state[-1] = 1
-        else:
-            state[-1] = 2
-        return state
-    
+        return self.decodeStates([s])[0]
+
+    def decodeStatesCNN(self, histories, out=None):
+        """ batch version of decodeStateCNN. Takes a sequence of B histories
+            and writes their encodings to out, a float32 array of shape
+            (B, 1DboardSize, 1DboardSize, 7) which is allocated if not passed
+        """
+        oneDsize = self._1Dsize
+        numRows = self._boardSize // oneDsize
+        if out is None:
+            out = np.zeros((len(histories), numRows, oneDsize, 7), dtype=np.float32)
+        # last 3 states of every history, most recent first, padded with the
+        # empty board at the start of the game
+        emptyState = "0"*self._boardSize
+        states = []
+        for h in histories:
+            for k in range(3):
+                states.append(h[-1*k-1] if k < len(h) else emptyState)
+        squares = self.unpackStates(states).reshape(len(histories), 3,
+                                                    numRows, oneDsize)
+        squares = squares.transpose(0, 2, 3, 1)
+        np.equal(squares, 1, out=out[..., 0:3], casting='unsafe')
+        np.equal(squares, 2, out=out[..., 3:6], casting='unsafe')
+        # O is to move when the latest state has an even number of marks
+        OtoMove = np.count_nonzero(squares[..., 0], axis=(1, 2)) % 2 == 0
+        out[..., 6] = OtoMove[:, None, None]
+        return out
+
     def decodeStateCNN(self, h):
         """ takes hisory, where each element is a state and returns
             a 3D array: 1DboardSize*1DboardSize*7
@@ -56,43 +256,34 @@ class tttBoard:
             Where O{s} and X{s} represent 1DboardSize*1DboardSize arrays representing 
             there postions as 1 for occupied and 0 for unoccupied at time s
             C is constant 1DboardSize*1DboardSize array, 1 for O and 0 for X 
-
-            Third layer contains 
         """
-        oneDsize = self._1Dsize
-        state = np.zeros((1,oneDsize,oneDsize,7))        
-        hist = list(range(3))
-        numMoves = min(len(h),3)
-        if numMoves <= 3:
-            for k in range(numMoves):
-                hist[k] = h[-1*k-1]
-                
-        for k in range(numMoves,3):
-            hist[k] = '000000000'
-        for n in range(3):
-            s = hist[n]
-            for i in range(self._boardSize):
-                row,col = np.divmod(i,oneDsize)
-                if s[i] == '1':
-                    state[0,row,col,n] = 1
-                elif s[i] == '2':
-                    state[0,row,col,n+3] = 1                
-        
-        if self.currPlayer() == 1:
-            state[0,:,:,6] = 1
-        else:
-            state[0,:,:,6] = 0
-        return state
+        return self.decodeStatesCNN([h])
 
     def currPlayer(self):
-        if len(self._moveHistory)==0:
-            #if fist move, currPlayer is 1 = O
-            return 1
-        if 'O' in self._moveHistory[-1] :
-            #if last move was made by O, current player is X
-            return 2 
-        else:
+        #O makes the even plies, starting with the first move
+        if self._ply % 2 == 0:
             return 1
+        return 2
+
+    def moveHistory(self):
+        """ returns the list of moves made so far """
+        return self._moves[:self._ply].tolist()
+
+    def stateHistory(self, count=None):
+        """ returns the list of states after each move made so far, oldest
+            first. count limits it to the most recent ones. States are not
+            stored, they are rebuilt from the current one by taking moves back
+        """
+        if count is None or count > self._ply:
+            count = self._ply
+        states = []
+        state = self._state
+        for ply in range(self._ply - 1, self._ply - 1 - count, -1):
+            states.append(state)
+            move = self._moves[ply]
+            state = state[:move] + '0' + state[move+1:]
+        states.reverse()
+        return states
 
     def stateToPlayer(self,state):
         numX = 0
@@ -120,7 +311,7 @@ class tttBoard:
     def display(self):
         boardString = ""
         for ii in range(self._boardSize):
-            boardSq = self._board[ii]
+            boardSq = self.playerAt(ii)
             if ii % self._1Dsize == 0:
                 boardString += "\n"
             if boardSq == 1:
@@ -134,103 +325,172 @@ class tttBoard:
     # Generate all possible moves from current board state
     # A move is an integer position for Boardsq at which move is to be made
     def legalMoves(self):
-        legalmoves = []
-        for i in range(self._boardSize):
-            boardSq = self._board[i]
-            if boardSq == 0: #if position empty
-                legalmoves.append(i)
-        return legalmoves
+        # a copy, so callers are free to modify the returned list
+        return self._legalMoves[:]
 
     # Make the passed move on the board for the side whose
     # turn it is. After making the move update the side to
     # make next move
     def makeMove(self, move):
-        assert( move in self.legalMoves())
-        self._board[move] = self.currPlayer()
-        self._stateHistory.append(self.getState())
-        if self.currPlayer() == 1:
-            self._moveHistory.append('O'+str(move))
+        # moves may come in as numpy integers, which would overflow the
+        # bitboards on large boards
+        move = int(move)
+        moveBit = 1 << move
+        assert(0 <= move < self._boardSize and not self._occupied & moveBit)
+        player = self.currPlayer()
+        if player == 1:
+            self._Oboard |= moveBit
         else:
-            self._moveHistory.append('X'+str(move))
-        return self._board
+            self._Xboard |= moveBit
+        self._occupied |= moveBit
+        self._hash ^= self._zobrist[player-1][move]
+        self._state = self._state[:move] + str(player) + self._state[move+1:]
+        self._legalMoves.remove(move)
+        self._moves[self._ply] = move
+        self._ply += 1
+
+    # Take back the last move made, restoring the board exactly as it was
+    # before it. Returns the move taken back
+    def unmakeMove(self):
+        self._ply -= 1
+        move = self._moves[self._ply]
+        moveBit = 1 << move
+        if self._ply % 2 == 0:
+            self._Oboard &= ~moveBit
+            self._hash ^= self._zobrist[0][move]
+        else:
+            self._Xboard &= ~moveBit
+            self._hash ^= self._zobrist[1][move]
+        self._occupied &= ~moveBit
+        self._state = self._state[:move] + '0' + self._state[move+1:]
+        insort(self._legalMoves, move)
+        return move
+
+    undo = unmakeMove
+
+    def clone(self):
+        """ returns a copy of the board to play moves on. Everything but the
+            small arrays of empty squares and moves is immutable, so it is
+            shared with this board
+        """
+        board = self.__class__.__new__(self.__class__)
+        board.__dict__.update(self.__dict__)
+        board._legalMoves = self._legalMoves[:]
+        board._moves = self._moves[:]
+        return board
 
 
     def playerAt(self, cell):
         """ returns id of player occupying cell
         """
-        assert(cell >= 0 and cell < self.getSize() * self.getSize())
-        return self._board[cell]
+        assert(cell >= 0 and cell < self._boardSize)
+        if (self._Oboard >> cell) & 1:
+            return 1
+        if (self._Xboard >> cell) & 1:
+            return 2
+        return 0
 
 
     def getSize(self):
         return self._1Dsize
 
     def getState(self):
-        return "".join([str(p) for p in self._board])
+        return self._state
     
     
     def getStateAfterMove(self, move):
-        boardcopy = self._board[:]
-        boardcopy[move] = self.currPlayer()
-        return "".join([str(p) for p in boardcopy])
+        return self._state[:move] + str(self.currPlayer()) + self._state[move+1:]
 
-    #Check the winner by checking all rows, all columns and then 2 diagonals
-    # we will assume indexing of positons in board and corresponding in integer
-    #evalBoard is one player's board
+    #Check the winner by testing the precomputed masks of all rows, columns
+    #and diagonals. evalBoard is one player's board
     #a n-bit integer with 0s at empty places and 1 at places occupied by player
-
     def checkWin(self,evalBoard):
-        # function to check if a given bit in n-bit is 1 or not
-        def testBit(num, bitpos):
-            return ( num & ( 1 << bitpos ) )
-        #we set these values to be true and later and them with test bit for
-        #locations we need to check. If unoccupied, they will turn False
-        oneDBoardSize = self._1Dsize
-        winDiag1 = True
-        winDiag2 = True
-        #check diagonals first
-        for jj in range(oneDBoardSize):
-            winDiag1 = winDiag1 and testBit(evalBoard,jj*(oneDBoardSize+1))
-            winDiag2 = winDiag2 and testBit(evalBoard,(jj+1)*(oneDBoardSize-1))
-        if winDiag1 or winDiag2:
-            return True
-        #check rows and columns
-        for ii in range(oneDBoardSize):
-            winRow = True
-            winCol = True
-            startRow = ii*oneDBoardSize 
-            startCol = ii
-            row  = startRow
-            col =  startCol
-            for jj in range(oneDBoardSize):
-                #win will be set to False if testing pos is empty
-                #check rows
-                row = startRow+jj
-                winRow = winRow and testBit(evalBoard,row)
-                #check column
-                col = startCol + jj*oneDBoardSize
-                winCol = winCol and testBit(evalBoard,col)
-            if winRow or winCol:
+        for line in self._winLines:
+            if evalBoard & line == line:
                 return True
         # if no win occured
         return False
 
-    #To check winner, we create a n bit integer for each player with 0s at 
+    def lastMoveWins(self, move):
+        """ returns True if the mark on square move completes a line. Only
+            the lines through move are tested, so this is the cheap check to
+            use right after makeMove(move)
+        """
+        moveBit = 1 << move
+        if self._Oboard & moveBit:
+            evalBoard = self._Oboard
+        elif self._Xboard & moveBit:
+            evalBoard = self._Xboard
+        else:
+            return False
+        for line in self._cellLines[move]:
+            if evalBoard & line == line:
+                return True
+        return False
+
+    def linePriors(self):
+        """ returns list of heuristic value of each legal move, in the order
+            of legalMoves, for the player to move. Every line through the
+            move free of opponent marks adds 2*4**(own marks on it) and every
+            line free of own marks, which the move blocks, adds
+            4**(opponent marks on it). A winning move outranks a block, which
+            outranks anything else
+        """
+        player = self.currPlayer()
+        own = self._Oboard if player == 1 else self._Xboard
+        other = self._Xboard if player == 1 else self._Oboard
+        priors = []
+        for move in self._legalMoves:
+            value = 0
+            for line in self._cellLines[move]:
+                ownCount = bin(own & line).count('1')
+                otherCount = bin(other & line).count('1')
+                if not otherCount:
+                    value += 2 * 4**ownCount
+                if not ownCount:
+                    value += 4**otherCount
+            priors.append(value)
+        return priors
+
+    def randomPlayout(self, finalBoards=None):
+        """ plays the game out from the current position with uniformly random
+            moves and returns the winner, as winner() would at the end. The
+            empty squares are shuffled once and filled in that order on local
+            copies of the bitboards, checking only the lines through each
+            move, so the board itself is left untouched. If list finalBoards
+            is passed, it is set to [0, O bitboard, X bitboard] at the end
+        """
+        winner = self.winner()
+        playerBoards = [0, self._Oboard, self._Xboard]
+        if not winner:
+            winner = -1
+            player = self.currPlayer()
+            cellLines = self._cellLines
+            emptySquares = self._legalMoves[:]
+            shuffle(emptySquares)
+            for move in emptySquares:
+                playerBoard = playerBoards[player] | (1 << move)
+                playerBoards[player] = playerBoard
+                for line in cellLines[move]:
+                    if playerBoard & line == line:
+                        winner = player
+                        break
+                if winner > 0:
+                    break
+                player = 3 - player
+        if finalBoards is not None:
+            finalBoards[:] = playerBoards
+        return winner
+
+    #To check winner, we use the n bit integer kept for each player with 0s at 
     #empty places and 1s at places player occupies
     def winner(self):
-        Oboard = 0
-        Xboard = 0
-        for ii in range(self._boardSize):
-            if self._board[ii] == 1:
-                Oboard += 2**ii
-            if self._board[ii] == 2:
-                Xboard += 2**ii
         winner = 0
-        if self.checkWin(Oboard):
+        if self.checkWin(self._Oboard):
             winner = 1
-        elif self.checkWin(Xboard):
+        elif self.checkWin(self._Xboard):
             winner = 2
         else:
-            if not self.legalMoves():
+            if self._occupied == self._fullBoard:
                 winner = -1
         return winner
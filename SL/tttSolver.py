@@ -0,0 +1,145 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+import os
+import numpy as np
+from random import choice
+from tttBoard import tttBoard
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# value of a position for the player to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+# table entry of positions which can not be reached from the empty board
+UNREACHABLE = -2
+
+class tttSolver:
+    """ perfect play tablebase of nxn tic tac toe, built by retrograde analysis.
+        Every position reachable from the empty board gets its game theoretic
+        value for the player to move, the number of moves to the end of the
+        game with perfect play and the set of moves keeping that value.
+        Records are kept in a memory mapped file indexed by the state read as
+        a base 3 number, so a lookup is a single array access
+    """
+    recordType = np.dtype([('value', 'i1'), ('distance', 'u1'), ('moves', '<u4')])
+
+    def __init__(self, n, k=None, fileName=None):
+        self._1Dsize = n
+        self._boardSize = n*n
+        self._k = n if k is None else k
+        assert(self._boardSize <= 32)   # moves are kept in 32 bit masks
+        if fileName is None:
+            fileName = "tttTablebase{0}x{0}k{1}.dat".format(n, self._k)
+        self._fileName = fileName
+        if os.path.exists(fileName):
+            self._table = np.memmap(fileName, dtype=tttSolver.recordType,
+                                    mode='r', shape=(3**self._boardSize,))
+        else:
+            self.solve()
+
+    def index(self, state):
+        """ returns record index of state, the state read as a base 3 number """
+        return int(state, 3)
+
+    def boardFromState(self, state):
+        """ returns a tttBoard with position state on it """
+        board = tttBoard(self._1Dsize, self._k)
+        Omoves = [ii for ii in range(self._boardSize) if state[ii] == '1']
+        Xmoves = [ii for ii in range(self._boardSize) if state[ii] == '2']
+        for ii in range(len(Omoves)):
+            board.makeMove(Omoves[ii])
+            if ii < len(Xmoves):
+                board.makeMove(Xmoves[ii])
+        return board
+
+    def solve(self):
+        """ enumerates all reachable positions, up to symmetry, one ply at a
+            time and then solves them from the last ply back to the empty
+            board. Results are written to every symmetric copy in the file
+        """
+        n = self._1Dsize
+        emptyBoard = tttBoard(n, self._k)
+        perms, inversePerms, gathers = tttBoard.symmetries(n)
+        # canonical positions reachable at each ply
+        plies = [[emptyBoard.getState()]]
+        for ply in range(self._boardSize):
+            nextPly = set()
+            for state in plies[-1]:
+                board = self.boardFromState(state)
+                if board.winner():
+                    continue
+                for move in board.legalMoves():
+                    nextPly.add(board.canonicalize(board.getStateAfterMove(move))[0])
+            if not nextPly:
+                break
+            plies.append(sorted(nextPly))
+
+        self._table = np.memmap(self._fileName, dtype=tttSolver.recordType,
+                                mode='w+', shape=(3**self._boardSize,))
+        self._table['value'] = UNREACHABLE
+        solved = {}
+        for ply in reversed(plies):
+            for state in ply:
+                board = self.boardFromState(state)
+                winner = board.winner()
+                if winner > 0:
+                    # previous move won, the player to move has lost
+                    value, distance, moves = LOSS, 0, []
+                elif winner == -1:
+                    value, distance, moves = DRAW, 0, []
+                else:
+                    children = {}
+                    for move in board.legalMoves():
+                        child = board.canonicalize(board.getStateAfterMove(move))[0]
+                        childValue, childDistance = solved[child]
+                        children[move] = (-childValue, childDistance + 1)
+                    value = max(v for v, d in children.values())
+                    moves = [m for m in children if children[m][0] == value]
+                    distances = [children[m][1] for m in moves]
+                    # win as fast as possible, otherwise hold out the longest
+                    distance = min(distances) if value == WIN else max(distances)
+                solved[state] = (value, distance)
+                for t in range(8):
+                    record = self._table[self.index("".join(gathers[t](state)))]
+                    record['value'] = value
+                    record['distance'] = distance
+                    record['moves'] = sum(1 << perms[t][m] for m in moves)
+        self._table.flush()
+
+    def lookup(self, board):
+        """ returns tuple (value, distance, moves) for position on board.
+            value is WIN, DRAW or LOSS for the player to move, distance the
+            number of moves to the end of the game and moves the list of
+            moves keeping value. value is UNREACHABLE for positions which
+            can not come up in a game
+        """
+        record = self._table[self.index(board.getState())]
+        movesMask = int(record['moves'])
+        moves = [m for m in range(self._boardSize) if (movesMask >> m) & 1]
+        return int(record['value']), int(record['distance']), moves
+
+    def value(self, board):
+        """ returns game theoretic value of board for the player to move """
+        return int(self._table[self.index(board.getState())]['value'])
+
+    def bestMove(self, board):
+        """ returns a random move among the optimal ones """
+        return choice(self.lookup(board)[2])
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    import time
+    begin = time.perf_counter()
+    solver = tttSolver(3)
+    print("tablebase ready in {0:.2f}s".format(time.perf_counter() - begin))
+    values = solver._table['value']
+    print("reachable positions:", np.count_nonzero(values != UNREACHABLE))
+    board = tttBoard(3)
+    print("empty board:", solver.lookup(board))
+    board.makeMove(1)
+    print("after O plays 1:", solver.lookup(board))
+    begin = time.perf_counter()
+    for ii in range(100000):
+        solver.value(board)
+    print("{0:.2f}us per lookup".format((time.perf_counter() - begin) * 10))
@@ -1,8 +1,13 @@
 #code to play with AI
 from tttBoard import tttBoard
-from monteCarlo import monteCarlo
+from monteCarloTree import monteCarloTree
 board = tttBoard(3)
 board.display()
+# one search tree for the whole game, re-rooted after every move so that
+# playouts made for earlier moves are kept. It ponders while waiting for
+# input, and answers as soon as its root has movePlayouts playouts
+ttt = monteCarloTree(board, movePlayouts=20000)
+ttt.ponder()
 def checkWin(board):
     if (board.winner()):
         if(board.winner()==1):
@@ -21,14 +26,16 @@ while len(board.legalMoves()) > 0 and not(checkWin(board)):
     print(board.legalMoves())
     pMove = int(input("choose from above list of moves"))
     board.makeMove(pMove)
+    ttt.advance(pMove)
     board.display()
     if checkWin(board):
         break
     print('Thinking...')
-    ttt = monteCarlo(board)
     tttMove = ttt.getMove()
     board.makeMove(tttMove)
+    ttt.advance(tttMove)
     print('Thinking Tic Tac Toe move...'+str(tttMove))
     board.display()
     if checkWin(board):
         break
+ttt.stopPondering()
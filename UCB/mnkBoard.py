@@ -0,0 +1,136 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+from tttBoard import tttBoard
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+class mnkBoard(tttBoard):
+    """ m,n,k-game board: m rows, n columns and k marks in a row to win, as in
+        gomoku on 15x15 with k = 5. Squares are indexed row by row like
+        tttBoard, whose interface it keeps. Wins are found by scanning the
+        four directions through the last move, so a move costs O(k) however
+        large the board is, and the number of O and X marks on every k long
+        line is kept up to date for evaluation heuristics
+    """
+    # right, down, down-right and down-left
+    directions = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+    def __init__(self, m, n, k):
+        tttBoard.__init__(self, n, k, rows=m)
+        # winner is found when the winning move is made, _winPly is its ply
+        self._winner = 0
+        self._winPly = -1
+        # _lineCounts[player][l] is the number of marks of player on line l
+        # of _winLines, _cellLineIndices[i] the lines through square i
+        lineIndex = {line: l for l, line in enumerate(self._winLines)}
+        self._cellLineIndices = tuple(tuple(lineIndex[line] for line in lines)
+                                      for lines in self._cellLines)
+        self._lineCounts = (None, [0]*len(self._winLines), [0]*len(self._winLines))
+
+    def getSize(self):
+        return self._1Dsize
+
+    def makeMove(self, move):
+        tttBoard.makeMove(self, move)
+        move = int(move)
+        player = 2 - self._ply % 2
+        counts = self._lineCounts[player]
+        for l in self._cellLineIndices[move]:
+            counts[l] += 1
+        if not self._winner and self.lastMoveWins(move):
+            self._winner = player
+            self._winPly = self._ply - 1
+
+    def unmakeMove(self):
+        move = tttBoard.unmakeMove(self)
+        counts = self._lineCounts[1 if self._ply % 2 == 0 else 2]
+        for l in self._cellLineIndices[move]:
+            counts[l] -= 1
+        if self._ply == self._winPly:
+            self._winner = 0
+            self._winPly = -1
+        return move
+
+    undo = unmakeMove
+
+    def clone(self):
+        board = tttBoard.clone(self)
+        board._lineCounts = (None, self._lineCounts[1][:], self._lineCounts[2][:])
+        return board
+
+    def lastMoveWins(self, move):
+        """ returns True if the mark on square move has k in a row through it,
+            scanning at most k-1 squares each way in the four directions
+        """
+        moveBit = 1 << move
+        if self._Oboard & moveBit:
+            evalBoard = self._Oboard
+        elif self._Xboard & moveBit:
+            evalBoard = self._Xboard
+        else:
+            return False
+        row, col = divmod(move, self._1Dsize)
+        for dRow, dCol in mnkBoard.directions:
+            inRow = 1
+            for sign in (1, -1):
+                r, c = row + sign*dRow, col + sign*dCol
+                while (inRow < self._k and 0 <= r < self._rows and
+                       0 <= c < self._1Dsize and
+                       (evalBoard >> (r*self._1Dsize + c)) & 1):
+                    inRow += 1
+                    r, c = r + sign*dRow, c + sign*dCol
+            if inRow >= self._k:
+                return True
+        return False
+
+    def winner(self):
+        if self._winner:
+            return self._winner
+        if self._occupied == self._fullBoard:
+            return -1
+        return 0
+
+    def linePriors(self):
+        """ as tttBoard.linePriors, from the line counts """
+        player = 1 + self._ply % 2
+        own = self._lineCounts[player]
+        other = self._lineCounts[3 - player]
+        priors = []
+        for move in self._legalMoves:
+            value = 0
+            for l in self._cellLineIndices[move]:
+                if not other[l]:
+                    value += 2 * 4**own[l]
+                if not own[l]:
+                    value += 4**other[l]
+            priors.append(value)
+        return priors
+
+    def lineCounts(self, player):
+        """ returns list of the number of marks of player on every k long
+            line, in the order of the lines of tttBoard.winLines
+        """
+        return self._lineCounts[player]
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # benchmark random playouts from the empty board. tttBoard checks every
+    # win line after each move, mnkBoard only the lines through the last one
+    import time
+    from random import shuffle
+    for n, k in ((3, 3), (7, 5), (15, 5)):
+        for name, newBoard in (("tttBoard", lambda: tttBoard(n, k)),
+                               ("mnkBoard", lambda: mnkBoard(n, n, k))):
+            count = 0
+            begin = time.perf_counter()
+            while time.perf_counter() - begin < 1:
+                board = newBoard()
+                moves = board.legalMoves()
+                shuffle(moves)
+                for move in moves:
+                    board.makeMove(move)
+                    if board.winner():
+                        break
+                count += 1
+            elapsed = time.perf_counter() - begin
+            print("{0}x{0} k={1} {2}: {3:.0f} playouts/s".format(n, k, name, count / elapsed))
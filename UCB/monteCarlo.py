@@ -1,23 +1,113 @@
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
 from __future__ import division
-import datetime, copy
+import datetime, time
+import multiprocessing, random
+import numpy as np
 from random import choice
-from math import log, sqrt
+from math import log, sqrt, ceil
+from batchBoard import batchBoard
+from searchBudget import searchBudget
+from transpositionTable import transpositionTable
 
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
+# proven value of a move for the player making it
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+def searchRoot(board, kwargs, seed):
+    """ runs one of the independent searches of a root parallel search in a
+        worker process. Returns number of simulations run, maximum depth
+        searched, the usage of its budget and the list of (plays, wins,
+        losses) of every legal move
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    searcher = monteCarlo(board, **kwargs)
+    games = searcher.search()
+    player = board.currPlayer()
+    return (games, searcher._maxDepth, searcher._budget.usage(),
+            [(searcher._plays.get((player,S),0),
+              searcher._wins.get((player,S),0),
+              searcher._losses.get((player,S),0))
+             for p,S in searcher.movesStates(board)])
+
 class monteCarlo:
     def __init__(self, board, **kwargs):
         self._board = board
-        seconds = kwargs.get('time', 1)
-        self._simTime = datetime.timedelta(seconds = seconds)
+        # number of processes searching the root in parallel, each with its
+        # own tree and seed. Their statistics of the root moves are summed
+        self._workers = kwargs.get('workers', 1)
+        self._kwargs = dict(kwargs, workers=1)
+        # searchBudget limiting every search, by default time seconds long.
+        # With workers each process searches with the whole budget
+        self._budget = kwargs.get('budget')
+        if self._budget is None:
+            self._budget = searchBudget(seconds=kwargs.get('time', 1))
         self._maxMoves = kwargs.get('maxMoves', 100)
-        self._wins = {}
-        self._plays = {}
-        self._losses = {}
+        # statistics tables, at most maxEntries keys or about maxBytes bytes
+        # if given, evicting the least recent or least visited states first
+        self._table = transpositionTable(('plays', 'wins', 'losses', 'proven'),
+                                         kwargs.get('maxEntries'),
+                                         kwargs.get('maxBytes'),
+                                         kwargs.get('evict', 'recent'))
+        self._plays = self._table.table('plays')
+        self._wins = self._table.table('wins')
+        self._losses = self._table.table('losses')
         self._C = kwargs.get('C',1.4)
         self._maxDepth = 0
+        # store statistics under the symmetry-canonical state, so that all
+        # symmetric copies of a position share them
+        self._canonical = kwargs.get('canonical', False)
+        # store statistics under the zobrist hash of the state instead of the
+        # state string, which is cheaper to get and hash on large boards
+        self._zobrist = kwargs.get('zobrist', False)
+        # scratch board the simulations play on and roll back
+        self._simulationBoard = board.clone()
+        # when set, every new leaf is valued by this many random playouts
+        # played side by side on a batchBoard, instead of a single playout
+        rolloutBatch = kwargs.get('rolloutBatch', 0)
+        self._rollouts = None
+        if rolloutBatch:
+            self._rollouts = batchBoard(board.getSize(), rolloutBatch, board._k,
+                                        rows=board._boardSize // board.getSize())
+        # MCTS-Solver: moves whose result is certain are kept in the proven
+        # table along with their statistics, and evicted with them, valued
+        # WIN, DRAW or LOSS for the player making them. _solvedMove is set
+        # once the root position is solved
+        self._solver = kwargs.get('solver', True)
+        self._proven = self._table.table('proven')
+        self._solvedMove = None
+        # RAVE: all moves as first statistics of every tree position, keyed
+        # by its zobrist hash with one count per square, for the moves the
+        # player to move made from there on in any simulation. They are
+        # blended into selection with weight sqrt(raveK / (3 plays + raveK))
+        self._rave = kwargs.get('rave', False)
+        self._raveK = kwargs.get('raveK', 300)
+        if self._rave:
+            self._amafTable = transpositionTable(('visits', 'plays', 'wins'),
+                                                 kwargs.get('maxEntries'),
+                                                 kwargs.get('maxBytes'),
+                                                 kwargs.get('evict', 'recent'))
+            self._amafPlays = self._amafTable.table('plays')
+            self._amafWins = self._amafTable.table('wins')
+        # progressive widening: from a position only the k best moves by the
+        # line heuristic of the board can be selected, k growing with the
+        # plays N of the position as ceil(widenC * (N+1)**widenAlpha). The
+        # rank of every move is kept under the zobrist hash of the position
+        self._widening = kwargs.get('widening', False)
+        self._widenC = kwargs.get('widenC', 1)
+        self._widenAlpha = kwargs.get('widenAlpha', 0.4)
+        if self._widening:
+            self._priorTable = transpositionTable(('visits', 'ranks'),
+                                                  kwargs.get('maxEntries'),
+                                                  kwargs.get('maxBytes'),
+                                                  kwargs.get('evict', 'recent'))
+            self._priorRanks = self._priorTable.table('ranks')
         
     def printStats(self,dicStats,dicPlays,player,movesStates):
         for x in sorted(((100*dicStats.get((player,S),0)/
@@ -27,6 +117,17 @@ class monteCarlo:
                             for p,S in movesStates),
                             reverse=True) :
             print("{3}:{0:.2f}%({1}/{2})".format(*x))
+
+    def movesStates(self, board):
+        """ returns list of tuples of legal move and the state resulting from
+            move, as used for the keys of the statistics tables
+        """
+        if self._canonical:
+            return [(p, board.canonicalize(board.getStateAfterMove(p))[0])
+                    for p in board.legalMoves()]
+        if self._zobrist:
+            return [(p, board.keyAfterMove(p)) for p in board.legalMoves()]
+        return [(p, board.getStateAfterMove(p)) for p in board.legalMoves()]
         
     def getMove(self):
         """ Call AI to calculate best move from current state and return it """
@@ -38,20 +139,28 @@ class monteCarlo:
             return None
         if len(legalMoves) == 1:
             return legalMoves[0]
-        games = 0
+        # nothing to search for in a solved position
+        if self._solver:
+            move = self.solvedMove()
+            if move is not None:
+                print("Solved position, result: ", self.provenValue(move))
+                return move
         begin = datetime.datetime.utcnow() # gets current time
-        # run the simulation till the specified time
-        while datetime.datetime.utcnow() - begin < self._simTime:
-            self.runSimulation()
-            games += 1
+        if self._workers > 1:
+            games = self.searchParallel()
+        else:
+            games = self.search()
         # list of tuples of move and state resulting from move
-        movesStates = [(p,self._board.getStateAfterMove(p)) for p in legalMoves]
+        movesStates = self.movesStates(self._board)
         # Display the number of calls of `run_simulation` and the
         # time elapsed.
         print(games, (datetime.datetime.utcnow() - begin))
-        percentWins, move = max( ( (self._wins.get((player,S),0) - self._losses.get((player,S),0)) /
-                                    self._plays.get((player,S),1), p)
-                                for p,S in movesStates )
+        print(self._budget.report())
+        print(self._table.report())
+        move = self.bestMove()
+        if self._solvedMove is not None:
+            move = self._solvedMove
+            print("Solved position, result: ", self.provenValue(move))
         # print stats for winning
         print("Win stats")
         self.printStats(self._wins,self._plays,player,movesStates)
@@ -59,8 +168,8 @@ class monteCarlo:
         print("Loss stats")
         self.printStats(self._losses,self._plays,player,movesStates)
         
-        dicDraw = {(player,S):self._plays[(player,S)]-
-                        (self._wins[(player,S)] + self._losses[(player,S)])
+        dicDraw = {(player,S):self._plays.get((player,S),0)-
+                        (self._wins.get((player,S),0) + self._losses.get((player,S),0))
                     for p,S in movesStates}
         print("Draw stats")
         self.printStats(dicDraw,self._plays,player,movesStates)
@@ -68,27 +177,254 @@ class monteCarlo:
         print("Maximum Depth Searched: ",self._maxDepth)
         return move
 
+    def bestMove(self):
+        """ returns the played move with the best score, wins less losses
+            per play. With RAVE the most played move, as selection already
+            sends the plays to the moves it rates best while scores of rarely
+            played moves are noisy, and also when the budget may stop early.
+            A move proven to win comes first and moves proven to lose last
+        """
+        player = self._board.currPlayer()
+        movesStates = self.movesStates(self._board)
+        # a proven win is played at once, proven losses only if all are
+        proven = self._proven
+        for p,S in movesStates:
+            if proven.get((player,S)) == WIN:
+                return p
+        movesStates = [(p,S) for p,S in movesStates
+                       if proven.get((player,S)) != LOSS] or movesStates
+        # moves left out by widening have no plays and no score
+        movesStates = [(p,S) for p,S in movesStates if self._plays.get((player,S))] or movesStates
+        # an early stop only guarantees the most played move stays on top
+        if self._rave or self._budget.stopsEarly():
+            return max((self._plays.get((player,S),0), p) for p,S in movesStates)[1]
+        percentWins, move = max( ( (self._wins.get((player,S),0) - self._losses.get((player,S),0)) /
+                                    self._plays.get((player,S),1), p)
+                                for p,S in movesStates )
+        return move
+
+    def provenValue(self, move):
+        """ returns proven value of move from the current position for the
+            player making it, None if it is not proven
+        """
+        player = self._board.currPlayer()
+        for p,S in self.movesStates(self._board):
+            if p == move:
+                return self._proven.get((player,S))
+
+    def solvedMove(self):
+        """ returns the move to play if the current position is solved, a
+            proven win or, once every move is proven, a draw before a loss
+            and the best scoring move among equals. Returns None otherwise
+        """
+        player = self._board.currPlayer()
+        values = [(self._proven.get((player,S)),
+                   (self._wins.get((player,S),0) - self._losses.get((player,S),0)) /
+                    max(self._plays.get((player,S),0),1), p)
+                  for p,S in self.movesStates(self._board)]
+        for value, score, p in values:
+            if value == WIN:
+                return p
+        if any(value is None for value, score, p in values):
+            return None
+        return max(values)[2]
+
+    def prove(self, path, value):
+        """ marks the last move of path, the list of (player, movesStates,
+            state) of the positions of a simulation, proven with value and
+            backs proofs up: a move is a LOSS if the opponent has a winning
+            reply, and once all replies are proven it is worth minus the best
+            of them
+        """
+        proven = self._proven
+        player, movesStates, state = path[-1]
+        # proofs are only kept for states in the tables
+        if (player,state) in self._plays:
+            proven[(player,state)] = value
+        for t in range(len(path) - 2, -1, -1):
+            player, movesStates, state = path[t]
+            childPlayer, childMovesStates, childState = path[t + 1]
+            values = [proven.get((childPlayer,S)) for p,S in childMovesStates]
+            if WIN in values:
+                value = LOSS
+            elif None in values:
+                return
+            else:
+                value = -max(values)
+            if (player,state) in self._plays:
+                proven[(player,state)] = value
+        # a move of the root position has been proven
+        self._solvedMove = self.solvedMove()
+
+    def widen(self, board, player, movesStates):
+        """ returns the moves of movesStates, list of tuples of move and
+            state from the position on board, which rank among the k best by
+            board.linePriors for the number of plays of the position
+        """
+        key = board.key()
+        if not self._priorTable.lookup(key):
+            priors = board.linePriors()
+            moves = sorted(zip(priors, board.legalMoves()), key=lambda x: -x[0])
+            self._priorTable.add(key, 0, {p: rank for rank, (prior, p) in enumerate(moves)})
+        self._priorTable.touch(key)
+        self._priorTable.table('visits')[key] += 1
+        ranks = self._priorRanks[key]
+        plays = sum(self._plays.get((player,S),0) for p,S in movesStates)
+        k = int(ceil(self._widenC * (plays + 1)**self._widenAlpha))
+        return [(p,S) for p,S in movesStates if ranks[p] < k] or movesStates
+
+    def selectRave(self, player, movesStates, amafKey):
+        """ returns tuple of move and state to play from a position whose
+            AMAF statistics are under amafKey. Moves never played from it are
+            tried first, best AMAF value first. Then the UCB value is taken
+            with the win rate of a move blended with its AMAF win rate, whose
+            weight fades as the move's own plays grow
+        """
+        plays, wins = self._plays, self._wins
+        amafPlays, amafWins = self._amafPlays[amafKey], self._amafWins[amafKey]
+        unplayed = [(p,S) for p,S in movesStates if not plays.get((player,S))]
+        if unplayed:
+            value, tie, move, state = max((amafWins[p] / amafPlays[p] if amafPlays[p] else 1,
+                                           random.random(), p, S) for p,S in unplayed)
+            return move, state
+        logN = log(sum(plays[(player,S)] for p,S in movesStates))
+        k = self._raveK
+        value, move, state = max(((1 - sqrt(k / (3*plays[(player,S)] + k))) * wins[(player,S)] / plays[(player,S)] +
+                                  sqrt(k / (3*plays[(player,S)] + k)) * amafWins[p] / max(amafPlays[p], 1) +
+                                  self._C*sqrt(logN/plays[(player,S)]), p, S)
+                                 for p,S in movesStates)
+        return move, state
+
+    def updateAmaf(self, amafPath, finalBoards, winner, rolloutWinners):
+        """ adds a simulation to the AMAF statistics of the positions of
+            amafPath, list of tuples of player to move, key and occupied
+            squares, for every square player took from there on as found in
+            finalBoards, the [0, O, X] bitboards at the end of the simulation
+        """
+        games = 1 if rolloutWinners is None else len(rolloutWinners)
+        for player, key, occupied in amafPath:
+            if key not in self._amafPlays:
+                continue
+            self._amafTable.table('visits')[key] += games
+            if rolloutWinners is None:
+                won = 1 if winner == player else 0
+            else:
+                won = int((rolloutWinners == player).sum())
+            amafPlays, amafWins = self._amafPlays[key], self._amafWins[key]
+            later = finalBoards[player] & ~occupied
+            while later:
+                bit = later & -later
+                move = bit.bit_length() - 1
+                amafPlays[move] += games
+                amafWins[move] += won
+                later ^= bit
+
+    def rootVisits(self):
+        """ returns list of the number of plays of every legal move """
+        player = self._board.currPlayer()
+        return [self._plays.get((player,S),0) for p,S in self.movesStates(self._board)]
+
+    def search(self):
+        """ runs simulations till the budget is spent and returns how many """
+        games = 0
+        self._simulationBoard = self._board.clone()
+        player = self._board.currPlayer()
+        self._table.pin((player,S) for p,S in self.movesStates(self._board))
+        self._solvedMove = None
+        self._budget.start()
+        while self._budget.running(len(self._plays), self.rootVisits):
+            self.runSimulation()
+            games += 1
+            if self._solvedMove is not None:
+                self._budget.stop('solved')
+                break
+        return games
+
+    def searchParallel(self):
+        """ runs an independent search in each worker process for the
+            specified time and sums their statistics of the root moves into
+            the tables. Returns the total number of simulations
+        """
+        seed = random.getrandbits(32)
+        self._budget.start()
+        with multiprocessing.Pool(self._workers) as pool:
+            results = pool.starmap(searchRoot, [(self._board, self._kwargs, seed + ii)
+                                                for ii in range(self._workers)])
+        player = self._board.currPlayer()
+        movesStates = self.movesStates(self._board)
+        for p,S in movesStates:
+            self._plays.setdefault((player,S),0)
+            self._wins.setdefault((player,S),0)
+            self._losses.setdefault((player,S),0)
+        for games, maxDepth, usage, moveStats in results:
+            self._maxDepth = max(self._maxDepth, maxDepth)
+            # with canonical keys symmetric moves share a state, whose
+            # statistics are summed once
+            merged = set()
+            for (p,S),(plays,wins,losses) in zip(movesStates,moveStats):
+                if S in merged:
+                    continue
+                merged.add(S)
+                self._plays[(player,S)] += plays
+                self._wins[(player,S)] += wins
+                self._losses[(player,S)] += losses
+        # the budget reports the worker which went furthest
+        usage = max((result[2] for result in results), key=lambda u: u['simulations'])
+        self._budget.stop(usage['stoppedBy'], usage['simulations'], usage['nodes'])
+        games = sum(result[0] for result in results)
+        return games
+
     def runSimulation(self):
         """ Playout a random game and update the statistics table """
         # copying some variables so that we have variable lookup instead of
         # attribute call, to make code faster
         plays, wins = self._plays, self._wins
+        self._table.tick()
         expandTree = True
         visitedStates = set()
         player = self._board.currPlayer()
 
-        # should run this simulation on a copy so as not to corrupt the actual
-        # board by making moves on it
-        simulationBoard = copy.deepcopy(self._board)
+        # moves are made on the scratch board so as not to corrupt the actual
+        # board, and taken back once the simulation is over
+        simulationBoard = self._simulationBoard
+        movesMade = 0
+        winner = 0
+        rolloutWinners = None
+        proven = self._proven
+        path = []
+        # positions of the simulation and the bitboards at its end for RAVE
+        amafPath = []
+        finalBoards = []
+        if self._rave:
+            self._amafTable.tick()
+        if self._widening:
+            self._priorTable.tick()
 
         for t in range(1, self._maxMoves + 1):
-            legalMoves = simulationBoard.legalMoves()
-            movesStates = [(p, simulationBoard.getStateAfterMove(p)) for p in legalMoves]
+            movesStates = self.movesStates(simulationBoard)
             if len(movesStates) == 0:
                 break
+            if self._solver:
+                path.append((player, movesStates, None))
+                if proven:
+                    # a proven win is played at once, proven losses never
+                    winning = [(p,S) for p,S in movesStates if proven.get((player,S)) == WIN]
+                    movesStates = winning[:1] or [(p,S) for p,S in movesStates
+                                    if proven.get((player,S)) != LOSS] or movesStates
+            if self._widening:
+                movesStates = self.widen(simulationBoard, player, movesStates)
+            if self._rave:
+                amafKey = simulationBoard.key()
+                if self._amafTable.lookup(amafKey):
+                    self._amafTable.touch(amafKey)
+                else:
+                    self._amafTable.add(amafKey, 0, [0]*simulationBoard._boardSize,
+                                        [0]*simulationBoard._boardSize)
+                amafPath.append((player, amafKey, simulationBoard._occupied))
+                move, state = self.selectRave(player, movesStates, amafKey)
             # if stats exist for all legal moves
             # use the UCB formula
-            if all(plays.get((player, S)) for p, S in movesStates):
+            elif all(plays.get((player, S)) for p, S in movesStates):
                 N = sum(plays.get((player,S)) for p,S in movesStates)
                 logN = log(N)
                 value, move, state = max( ( (wins[(player,S)] / plays[(player,S)]) + self._C*sqrt(logN/plays[(player,S)]), p, S) for p, S in movesStates)
@@ -96,33 +432,171 @@ class monteCarlo:
                # Play randomly
                move, state = choice(movesStates)
 
-            # If this is a new leaf, set statistics to 0
-            if expandTree and (player, state) not in self._plays:
-                expandTree = False
-                self._plays[(player, state)] = 0
-                self._wins[(player, state)]  = 0
-                self._losses[(player, state)]  = 0
-                if t > self._maxDepth:
-                    self._maxDepth = t
+            # If this is a new leaf, set statistics to 0. Positions on the way
+            # are touched as they are reached, so that adding the leaf cannot
+            # evict them
+            if expandTree:
+                if self._table.lookup((player, state)):
+                    self._table.touch((player, state))
+                else:
+                    expandTree = False
+                    self._table.add((player, state), 0, 0, 0)
+                    if t > self._maxDepth:
+                        self._maxDepth = t
 
             # Add the current position to visited boards
             visitedStates.add((player, state))
+            if self._solver:
+                path[-1] = (player, path[-1][1], state)
+                value = proven.get((player, state))
+                if value is not None:
+                    # result of the move is certain, no need to play it out
+                    winner = player if value == WIN else -1 if value == DRAW else simulationBoard.opponent(player)
+                    self.prove(path, value)
+                    break
             # Set board and player
             simulationBoard.makeMove(move)
+            movesMade += 1
             player = simulationBoard.currPlayer()
             winner = simulationBoard.winner()
 
             if winner:
+                if self._solver:
+                    self.prove(path, WIN if winner == path[-1][0] else DRAW)
+                break
+            if not expandTree:
+                # below the new leaf only the result of a random game is
+                # needed, which the playout kernel gets without any states
+                if self._rollouts is not None:
+                    self._rollouts.loadBoard(simulationBoard)
+                    rolloutWinners = self._rollouts.randomPlayouts()
+                else:
+                    winner = simulationBoard.randomPlayout(finalBoards if self._rave else None)
                 break
 
         loser = simulationBoard.opponent(winner)
+        if self._rave:
+            if not finalBoards:
+                finalBoards = [0, simulationBoard._Oboard, simulationBoard._Xboard]
+            self.updateAmaf(amafPath, finalBoards, winner, rolloutWinners)
+        for t in range(movesMade):
+            simulationBoard.unmakeMove()
 
         # Update the win and play stats for the simulation
         for player, state in visitedStates:
             if (player, state) not in self._plays:
                 continue
+            if rolloutWinners is not None:
+                self._plays[(player,state)] += len(rolloutWinners)
+                self._wins[(player,state)] += int((rolloutWinners == player).sum())
+                self._losses[(player,state)] += int((rolloutWinners ==
+                                    simulationBoard.opponent(player)).sum())
+                continue
             self._plays[(player,state)] += 1
             if player == winner:
                 self._wins[(player,state)] += 1
             elif player == loser:
                 self._losses[(player,state)] += 1
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # benchmark the ways of getting a board to simulate on: deep copy for every
+    # simulation, cheap clone, or make and unmake moves on one scratch board
+    import copy
+    from tttBoard import tttBoard
+    board = tttBoard(3)
+    for move in (4, 0, 8):
+        board.makeMove(move)
+
+    def playout(simulationBoard):
+        movesMade = 0
+        while not simulationBoard.winner():
+            simulationBoard.makeMove(choice(simulationBoard.legalMoves()))
+            movesMade += 1
+        return movesMade
+
+    scratchBoard = board.clone()
+    def unmakePlayout():
+        for t in range(playout(scratchBoard)):
+            scratchBoard.unmakeMove()
+
+    searcher = monteCarlo(board, solver=False)
+    for name, run in (("deepcopy", lambda: playout(copy.deepcopy(board))),
+                      ("clone", lambda: playout(board.clone())),
+                      ("unmake", unmakePlayout),
+                      ("kernel", board.randomPlayout),
+                      ("monteCarlo", searcher.runSimulation)):
+        count = 0
+        begin = time.perf_counter()
+        while time.perf_counter() - begin < 1:
+            run()
+            count += 1
+        print("{0:>10}: {1:.0f} simulations/s".format(name, count / (time.perf_counter() - begin)))
+
+    # root parallel search throughput, total simulations in one second
+    for workers in (1, 2, 4, multiprocessing.cpu_count()):
+        games = monteCarlo(board, workers=workers, solver=False).searchParallel()
+        print("{0:>2} workers: {1} simulations/s".format(workers, games))
+
+    # bounded statistics tables on 5x5: table size, lookups and the move
+    # chosen with and without a cap, from the same position
+    board = tttBoard(5, 4)
+    for move in (12, 6):
+        board.makeMove(move)
+    for maxEntries, evict in ((None, 'recent'), (2000, 'recent'), (2000, 'visits')):
+        searcher = monteCarlo(board, maxEntries=maxEntries, evict=evict,
+                              budget=searchBudget(simulations=20000))
+        searcher.search()
+        visits = searcher.rootVisits()
+        best = max(zip(visits, board.legalMoves()))[1]
+        print("maxEntries {0} {1}: most visited move {2}".format(maxEntries, evict, best))
+        print(searcher._table.report())
+
+    # simulations spent on positions of tic tac toe, with and without the
+    # solver. Without it the search runs to its limit
+    for moves in ((), (0, 4, 1), (0, 3, 1, 4), (4, 0, 8)):
+        board = tttBoard(3)
+        for move in moves:
+            board.makeMove(move)
+        for solver in (False, True):
+            searcher = monteCarlo(board, solver=solver,
+                                  budget=searchBudget(simulations=50000))
+            games = searcher.search()
+            print("moves {0} solver {1}: {2} simulations, solved move {3}".format(
+                moves, solver, games, searcher._solvedMove))
+
+    # RAVE on 5x5 with 4 in a row: match of a RAVE search against plain
+    # searches with as many and twice as many simulations per move. A
+    # score near one half means the same strength
+    def playMatch(searchers, games):
+        score = 0
+        for game in range(games):
+            board = tttBoard(5, 4)
+            sides = {1: 0, 2: 1} if game % 2 == 0 else {1: 1, 2: 0}
+            while not board.winner():
+                simulations, kwargs = searchers[sides[board.currPlayer()]]
+                searcher = monteCarlo(board, solver=False,
+                                      budget=searchBudget(simulations=simulations), **kwargs)
+                searcher.search()
+                board.makeMove(searcher.bestMove())
+            winner = board.winner()
+            score += 0.5 if winner == -1 else 1 if sides[winner] == 0 else 0
+        return score / games
+    for plainSimulations in (300, 600):
+        print("rave 300 simulations against plain {0}: score {1:.2f}".format(
+            plainSimulations, playMatch(((300, {'rave': True}), (plainSimulations, {})), 40)))
+
+    # progressive widening on 15x15 gomoku, 2000 simulations from a position
+    # where X has to block the open three of O on the middle column at 82
+    # or 142. Without widening the search hardly gets past the root moves
+    from mnkBoard import mnkBoard
+    board = mnkBoard(15, 15, 5)
+    for move in (112, 113, 97, 98, 127):
+        board.makeMove(move)
+    for widening in (False, True):
+        searcher = monteCarlo(board, solver=False, widening=widening,
+                              budget=searchBudget(simulations=2000))
+        searcher.search()
+        print("15x15 widening {0}: depth {1}, move {2}, {3}".format(
+            widening, searcher._maxDepth, searcher.bestMove(), searcher._budget.report()))
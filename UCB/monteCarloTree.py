@@ -0,0 +1,361 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+from __future__ import division
+import datetime, threading
+import numpy as np
+from random import shuffle
+from math import log
+from searchBudget import searchBudget
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+class monteCarloTree:
+    """ UCB monte carlo tree search like monteCarlo, with the search tree kept
+        in an arena: one numpy column per node statistic instead of dicts
+        keyed by state strings. The children of a node sit next to each other
+        in the columns, so UCB over them is one vectorized expression on a
+        slice, and no child state is ever built as a string
+    """
+    def __init__(self, board, **kwargs):
+        self._board = board
+        # searchBudget limiting every search, by default time seconds long
+        self._budget = kwargs.get('budget')
+        if self._budget is None:
+            self._budget = searchBudget(seconds=kwargs.get('time', 1))
+        self._maxMoves = kwargs.get('maxMoves', 100)
+        self._C = kwargs.get('C',1.4)
+        self._maxDepth = 0
+        # node columns. player is the one who made move to reach the node, its
+        # wins and losses are from that player's point of view. Children of
+        # a node are the childCount nodes from firstChild, -1 if unexpanded
+        capacity = kwargs.get('capacity', 1024)
+        self._visits = np.zeros(capacity, dtype=np.int32)
+        self._wins = np.zeros(capacity, dtype=np.int32)
+        self._losses = np.zeros(capacity, dtype=np.int32)
+        self._firstChild = np.full(capacity, -1, dtype=np.int32)
+        self._childCount = np.zeros(capacity, dtype=np.int16)
+        self._move = np.zeros(capacity, dtype=np.int16)
+        self._player = np.zeros(capacity, dtype=np.int8)
+        self._size = 0
+        self._root = self.newNodes([-1], board.opponent(board.currPlayer()))
+        # scratch board the simulations play on and roll back
+        self._simulationBoard = board.clone()
+        # getMove stops searching once the root has this many playouts, so
+        # that after pondering it can answer at once. None for no target
+        self._movePlayouts = kwargs.get('movePlayouts')
+        # pondering, a thread searching from the root while the opponent
+        # thinks. It runs till ponderBudget is spent, by default till the
+        # tree holds 2M nodes, and pauses while the tree is re-rooted
+        self._ponderBudget = kwargs.get('ponderBudget')
+        if self._ponderBudget is None:
+            self._ponderBudget = searchBudget(nodes=1 << 21)
+        self._pondering = False
+        self._ponderThread = None
+        self._pauseEvent = threading.Event()
+
+    def numNodes(self):
+        return self._size
+
+    def newNodes(self, moves, player):
+        """ appends a node for each of moves, made by player, to the arena and
+            returns the index of the first one
+        """
+        first = self._size
+        self._size += len(moves)
+        if self._size > len(self._visits):
+            self.grow(max(self._size, 2*len(self._visits)))
+        self._visits[first:self._size] = 0
+        self._wins[first:self._size] = 0
+        self._losses[first:self._size] = 0
+        self._firstChild[first:self._size] = -1
+        self._childCount[first:self._size] = 0
+        self._move[first:self._size] = moves
+        self._player[first:self._size] = player
+        return first
+
+    def grow(self, capacity):
+        """ reallocates every column with room for capacity nodes """
+        for name in ('_visits', '_wins', '_losses', '_firstChild',
+                     '_childCount', '_move', '_player'):
+            column = getattr(self, name)
+            grown = np.full(capacity, -1 if name == '_firstChild' else 0,
+                            dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def advance(self, move):
+        """ re-roots the tree at the child of the root reached by move, once
+            move has been made on the board. The subtree below it is kept
+            with its statistics and the rest of the tree is freed. Pondering
+            goes on from the new root
+        """
+        self.pause()
+        newRoot = -1
+        for child in self.children(self._root):
+            if self._move[child] == move:
+                newRoot = child
+                break
+        if newRoot < 0:
+            # move was never searched, start again from an empty tree
+            self._size = 0
+            self._root = self.newNodes([move], self._board.opponent(self._board.currPlayer()))
+        else:
+            self.compact(newRoot)
+        self._maxDepth = 0
+        self.resume()
+
+    def ponder(self):
+        """ keeps searching from the root in a background thread till
+            stopPondering is called. advance and getMove pause it while they
+            work on the tree, progress tells what it has found meanwhile
+        """
+        self._pondering = True
+        self.resume()
+
+    def stopPondering(self):
+        """ stops the pondering thread for good """
+        self._pondering = False
+        self.pause()
+
+    def isPondering(self):
+        """ returns True while the pondering thread is searching """
+        return self._ponderThread is not None and self._ponderThread.is_alive()
+
+    def pause(self):
+        """ stops the pondering thread, if any, and waits for it to finish
+            its simulation
+        """
+        if self._ponderThread is not None:
+            self._pauseEvent.set()
+            self._ponderThread.join()
+            self._ponderThread = None
+
+    def resume(self):
+        """ restarts the pondering thread from the root if pondering is on
+            and the game is not over
+        """
+        if (not self._pondering or self._ponderThread is not None or
+            self._board.winner() or not self._board.legalMoves()):
+            return
+        self._simulationBoard = self._board.clone()
+        self._pauseEvent.clear()
+        self._ponderThread = threading.Thread(target=self.ponderSearch)
+        self._ponderThread.daemon = True
+        self._ponderThread.start()
+
+    def ponderSearch(self):
+        """ body of the pondering thread """
+        self._ponderBudget.start()
+        while (not self._pauseEvent.is_set() and
+               self._ponderBudget.running(self._size)):
+            self.runSimulation()
+
+    def progress(self):
+        """ returns tuple of playouts at the root, most visited root move and
+            its share of the playouts. Safe to call while pondering
+        """
+        children = self.children(self._root)
+        visits = self._visits[children.start:children.stop]
+        playouts = int(self._visits[self._root])
+        if not len(visits):
+            return playouts, None, 0
+        best = int(np.argmax(visits))
+        return (playouts, int(self._move[children.start + best]),
+                float(visits[best]) / max(playouts, 1))
+
+    def compact(self, root):
+        """ moves the subtree of node root to the front of the arena, root
+            first and children of every node still contiguous, dropping all
+            other nodes
+        """
+        columns = ('_visits', '_wins', '_losses', '_childCount', '_move', '_player')
+        old = {name: getattr(self, name)[:self._size].copy() for name in columns}
+        oldFirstChild = self._firstChild[:self._size].copy()
+        self._size = 0
+        self._root = self.newNodes([0], 0)
+        for name in columns:
+            getattr(self, name)[0] = old[name][root]
+        # breadth first, copy the children block of every expanded node
+        queue = [(root, self._root)]
+        for oldNode, newNode in queue:
+            # python ints, int16 sums would overflow past 32767 nodes
+            first = int(oldFirstChild[oldNode])
+            if first < 0:
+                continue
+            count = int(old['_childCount'][oldNode])
+            newFirst = self.newNodes(old['_move'][first:first + count], 0)
+            for name in columns:
+                getattr(self, name)[newFirst:newFirst + count] = old[name][first:first + count]
+            self._firstChild[newNode] = newFirst
+            queue.extend((first + ii, newFirst + ii) for ii in range(count))
+
+    def expand(self, node, board):
+        """ adds a child of node for every legal move on board, in random
+            order so that unvisited children can be tried first to last
+        """
+        moves = board.legalMoves()
+        shuffle(moves)
+        self._firstChild[node] = self.newNodes(moves, board.currPlayer())
+        self._childCount[node] = len(moves)
+
+    def children(self, node):
+        first = self._firstChild[node]
+        return range(first, first + self._childCount[node]) if first >= 0 else range(0)
+
+    def rootVisits(self):
+        """ returns the visit counts of the children of the root """
+        children = self.children(self._root)
+        return self._visits[children.start:children.stop]
+
+    def selectChild(self, node):
+        """ returns the child of expanded node to descend into. Unvisited
+            children are tried first, then the one with the best UCB value
+        """
+        first = self._firstChild[node]
+        end = first + self._childCount[node]
+        visits = self._visits[first:end]
+        leastVisited = int(visits.argmin())
+        if visits[leastVisited] == 0:
+            return first + leastVisited
+        ucb = self._wins[first:end] / visits + self._C*np.sqrt(log(self._visits[node]) / visits)
+        return first + int(np.argmax(ucb))
+
+    def printStats(self,stats,player):
+        root = self._root
+        for x in sorted(((100*stats[c]/max(self._visits[c],1),
+                          stats[c], self._visits[c], self._move[c])
+                            for c in self.children(root)),
+                            reverse=True) :
+            print("{3}:{0:.2f}%({1}/{2})".format(*x))
+
+    def getMove(self):
+        """ Call AI to calculate best move from current state and return it """
+        player = self._board.currPlayer()
+        legalMoves = self._board.legalMoves()
+        # no need to run simulation if there are no real choices
+        # so return accordingly
+        if not legalMoves:
+            return None
+        if len(legalMoves) == 1:
+            return legalMoves[0]
+        self.pause()
+        games = 0
+        reused = int(self._visits[self._root])
+        self._simulationBoard = self._board.clone()
+        begin = datetime.datetime.utcnow() # gets current time
+        # run the simulation till the budget is spent or the root has enough
+        # playouts
+        target = self._movePlayouts
+        self._budget.start()
+        while ((target is None or self._visits[self._root] < target) and
+               self._budget.running(self._size, self.rootVisits)):
+            self.runSimulation()
+            games += 1
+        if target is not None and self._visits[self._root] >= target:
+            self._budget.stop('playouts')
+        # Display the number of calls of `run_simulation` and the
+        # time elapsed.
+        print(games, (datetime.datetime.utcnow() - begin))
+        print(self._budget.report())
+        print("Playouts reused from previous turns: ", reused)
+        children = self.children(self._root)
+        visits = np.maximum(self._visits[children.start:children.stop], 1)
+        scores = (self._wins[children.start:children.stop] -
+                  self._losses[children.start:children.stop]) / visits
+        if self._budget.stopsEarly():
+            # an early stop only guarantees the most played move stays on top
+            scores = visits
+        move = int(self._move[children.start + int(np.argmax(scores))])
+        # print stats for winning
+        print("Win stats")
+        self.printStats(self._wins,player)
+        print("Loss stats")
+        self.printStats(self._losses,player)
+        print("Draw stats")
+        self.printStats(self._visits - self._wins - self._losses,player)
+        print("Maximum Depth Searched: ",self._maxDepth)
+        self.resume()
+        return move
+
+    def runSimulation(self):
+        """ Descend the tree with UCB, add the children of the first node
+            reached which has none, playout a random game from there and
+            update the statistics of the nodes on the path
+        """
+        simulationBoard = self._simulationBoard
+        node = self._root
+        path = [node]
+        movesMade = 0
+        winner = simulationBoard.winner()
+        while not winner and movesMade < self._maxMoves:
+            newLeaf = self._firstChild[node] < 0
+            if newLeaf:
+                self.expand(node, simulationBoard)
+            node = self.selectChild(node)
+            path.append(node)
+            simulationBoard.makeMove(int(self._move[node]))
+            movesMade += 1
+            winner = simulationBoard.winner()
+            if newLeaf:
+                break
+        if len(path) - 1 > self._maxDepth:
+            self._maxDepth = len(path) - 1
+
+        # random playout below the tree
+        if not winner:
+            winner = simulationBoard.randomPlayout()
+        for t in range(movesMade):
+            simulationBoard.unmakeMove()
+
+        # Update the win and play stats of the path, all at once
+        self._visits[path] += 1
+        if winner > 0:
+            won = self._player[path] == winner
+            self._wins[path] += won
+            self._losses[path] += ~won
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # benchmark simulations per second and memory per stored position against
+    # the dict based monteCarlo
+    import sys, time
+    from tttBoard import tttBoard
+    from monteCarlo import monteCarlo
+    for n in (3, 5):
+        board = tttBoard(n)
+        for searcher in (monteCarlo(board), monteCarloTree(board)):
+            count = 0
+            begin = time.perf_counter()
+            while time.perf_counter() - begin < 1:
+                searcher.runSimulation()
+                count += 1
+            elapsed = time.perf_counter() - begin
+            if isinstance(searcher, monteCarlo):
+                nodes = len(searcher._plays)
+                tables = (searcher._plays, searcher._wins, searcher._losses)
+                memory = sum(sys.getsizeof(t) for t in tables)
+                memory += sum(sys.getsizeof(key) + sys.getsizeof(key[1])
+                              for key in searcher._plays)
+            else:
+                nodes = searcher.numNodes()
+                memory = sum(getattr(searcher, name).itemsize for name in
+                             ('_visits', '_wins', '_losses', '_firstChild',
+                              '_childCount', '_move', '_player')) * nodes
+            print("{0}x{0} {1}: {2:.0f} simulations/s, {3} nodes, {4:.0f} bytes/node".format(
+                n, searcher.__class__.__name__, count / elapsed, nodes, memory / nodes))
+    # re-rooting keeps the statistics of a subtree larger than 32767 nodes
+    board = tttBoard(4)
+    searcher = monteCarloTree(board, C=0.3)
+    while searcher.numNodes() < 400000:
+        searcher.runSimulation()
+    children = searcher.children(searcher._root)
+    best = children.start + int(np.argmax(searcher.rootVisits()))
+    move, visits = int(searcher._move[best]), int(searcher._visits[best])
+    board.makeMove(move)
+    begin = time.perf_counter()
+    searcher.advance(move)
+    assert(searcher.numNodes() > 32767)
+    assert(searcher._visits[searcher._root] == visits)
+    print("4x4 advance: kept {0} nodes in {1:.2f}s".format(
+        searcher.numNodes(), time.perf_counter() - begin))
@@ -0,0 +1,161 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+from __future__ import division
+import time
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+class searchBudget:
+    """ limits of a single search: number of simulations, number of nodes in
+        the search tree and wall time in seconds, any of which may be None for
+        no limit. The clock is read with time.perf_counter once every
+        checkEvery simulations only. With earlyStop the search also ends as
+        soon as the root move with the most visits can not be overtaken by
+        the second one in the simulations left, which without a simulation
+        limit are estimated from the rate so far and the time left, and the
+        searcher then plays the move with the most visits, the one the test
+        is about, whatever its usual rule. A searcher calls start() then
+        running() before every simulation, and usage() or report() tell how
+        much of the budget went
+    """
+    def __init__(self, simulations=None, nodes=None, seconds=None,
+                 checkEvery=16, earlyStop=False):
+        self._maxSimulations = simulations
+        self._maxNodes = nodes
+        self._maxSeconds = seconds
+        self._checkEvery = max(1, checkEvery)
+        self._earlyStop = earlyStop
+        self.start()
+
+    def start(self):
+        """ resets the counters and the clock for a new search """
+        self._begin = time.perf_counter()
+        self._simulations = 0
+        self._nextCheck = 0
+        self._nodes = 0
+        self._seconds = 0
+        self._stoppedBy = None
+
+    def stop(self, reason, simulations=None, nodes=None):
+        """ ends the search for reason, one of 'simulations', 'nodes', 'time'
+            or 'early', or a reason of the searcher's own such as 'solved'.
+            simulations and nodes override the counts, for searches run
+            elsewhere such as in worker processes
+        """
+        if simulations is not None:
+            self._simulations = simulations
+        if nodes is not None:
+            self._nodes = nodes
+        self._seconds = time.perf_counter() - self._begin
+        self._stoppedBy = reason
+        return False
+
+    def remaining(self, elapsed):
+        """ returns the number of simulations still allowed, None if there is
+            no limit
+        """
+        remaining = None
+        if self._maxSimulations is not None:
+            remaining = self._maxSimulations - self._simulations
+        if self._maxSeconds is not None and elapsed > 0:
+            rate = self._simulations / elapsed
+            timeLeft = int(rate * (self._maxSeconds - elapsed))
+            remaining = timeLeft if remaining is None else min(remaining, timeLeft)
+        return remaining
+
+    def running(self, nodes=0, rootVisits=None, count=1):
+        """ returns True if one more simulation may be run, counting it, and
+            False once the budget is spent. nodes is the current size of the
+            tree, rootVisits a function returning the visit counts of the root
+            moves, only called when the clock is read. Searchers running
+            simulations in batches pass count, and get the number of them
+            allowed, at most count, then charge the number they ran with
+            consume()
+        """
+        if self._stoppedBy is not None:
+            return False
+        self._nodes = nodes
+        if self._maxSimulations is not None and self._simulations >= self._maxSimulations:
+            return self.stop('simulations')
+        if self._maxNodes is not None and nodes >= self._maxNodes:
+            return self.stop('nodes')
+        if self._simulations >= self._nextCheck:
+            self._nextCheck = self._simulations + self._checkEvery
+            elapsed = time.perf_counter() - self._begin
+            if self._maxSeconds is not None and elapsed >= self._maxSeconds:
+                return self.stop('time')
+            if self._earlyStop and rootVisits is not None and self._simulations:
+                visits = sorted(rootVisits(), reverse=True)
+                remaining = self.remaining(elapsed)
+                if (len(visits) > 1 and remaining is not None and
+                    visits[0] - visits[1] > remaining):
+                    return self.stop('early')
+        if count != 1:
+            if self._maxSimulations is not None:
+                count = min(count, self._maxSimulations - self._simulations)
+            return count
+        self._simulations += 1
+        return True
+
+    def stopsEarly(self):
+        """ returns True if the search may end early, in which case the most
+            visited root move is to be played
+        """
+        return self._earlyStop
+
+    def consume(self, simulations):
+        """ counts simulations run in a batch allowed by running() """
+        self._simulations += simulations
+
+    def usage(self):
+        """ returns dictionary of simulations run, tree nodes and seconds
+            spent, the fraction of each limit they used (None if unlimited)
+            and what stopped the search
+        """
+        def fraction(used, limit):
+            return None if not limit else used / limit
+        seconds = self._seconds if self._stoppedBy else time.perf_counter() - self._begin
+        return {'simulations': self._simulations,
+                'nodes': self._nodes,
+                'seconds': seconds,
+                'simulationsUsed': fraction(self._simulations, self._maxSimulations),
+                'nodesUsed': fraction(self._nodes, self._maxNodes),
+                'secondsUsed': fraction(seconds, self._maxSeconds),
+                'stoppedBy': self._stoppedBy}
+
+    def report(self):
+        """ returns usage as a line of text """
+        usage = self.usage()
+        parts = []
+        for name, fmt in (('simulations', '{0}'), ('nodes', '{0}'), ('seconds', '{0:.3f}')):
+            part = name + " " + fmt.format(usage[name])
+            if usage[name + 'Used'] is not None:
+                part += " ({0:.0f}%)".format(100*usage[name + 'Used'])
+            parts.append(part)
+        return "Budget: " + ", ".join(parts) + ", stopped by " + str(usage['stoppedBy'])
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # cost of the budget check per simulation and overshoot of a 0.1 second
+    # limit, reading the clock every simulation or every few
+    import datetime
+    count = 0
+    begin = datetime.datetime.utcnow()
+    while datetime.datetime.utcnow() - begin < datetime.timedelta(seconds=0.1):
+        count += 1
+    print("utcnow every simulation: {0:.0f} checks/s".format(count / 0.1))
+    for checkEvery in (1, 16, 256):
+        budget = searchBudget(seconds=0.1, checkEvery=checkEvery)
+        while budget.running():
+            pass
+        usage = budget.usage()
+        print("checkEvery {0:>3}: {1:.0f} checks/s, {2:.2f}ms over".format(
+            checkEvery, usage['simulations'] / usage['seconds'],
+            1000*(usage['seconds'] - 0.1)))
+    # early stop: one move gets every visit, so the search ends once the
+    # simulations left can not make up the difference
+    budget = searchBudget(simulations=1000, earlyStop=True)
+    visits = [0, 0]
+    while budget.running(rootVisits=lambda: visits):
+        visits[0] += 1
+    print(budget.report())
@@ -1,18 +1,21 @@
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
-import sys
+import sys, threading, queue
 from tttBoard import tttBoard
-from monteCarlo import monteCarlo
+from monteCarloTree import monteCarloTree
 from PyQt5 import QtCore, QtGui
 from PyQt5.QtCore import QPointF, QRect
 from PyQt5.QtGui import QPen, QImage, QPixmap
-from PyQt5.QtWidgets import QApplication, QDialog, QHBoxLayout, QLabel
+from PyQt5.QtWidgets import QApplication, QDialog, QHBoxLayout, QLabel, QVBoxLayout
 from PyQt5.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsPixmapItem
 
 # ------------------------------------------------------------------------------
 # a graphics scene to draw the board
 # ------------------------------------------------------------------------------
 class tttScene(QGraphicsScene):
+    # text about the engine's search, for the window to show
+    statusChanged = QtCore.pyqtSignal(str)
+
     def __init__(self, *args, **kwds):
         QGraphicsScene.__init__(self, *args, **kwds)
         self._canvasSize = kwds.get('size', 520)
@@ -20,6 +23,24 @@ class tttScene(QGraphicsScene):
         self._board = kwds.get('board', tttBoard(3))
         self._OImage = QImage("res/O.png")
         self._XImage = QImage("res/X.png")
+        # engine keeps its search tree between moves, see engineLoop. It
+        # searches in a background thread all the time, on the player's turn
+        # too, and answers as soon as its root has movePlayouts playouts
+        self._engine = monteCarloTree(self._board, movePlayouts=20000)
+        self._engine.ponder()
+        self._engineToMove = False
+        # re-rooting the tree and the engine's search run in a worker thread,
+        # fed with tuples of the player's move and whether the engine is to
+        # reply. It hands back tuples of its move and the side which made it
+        self._playerMoves = queue.Queue()
+        self._engineMoves = queue.Queue()
+        self._engineThread = threading.Thread(target=self.engineLoop)
+        self._engineThread.daemon = True
+        self._engineThread.start()
+        # the engine is polled from the event loop, which is never blocked
+        self._timer = QtCore.QTimer()
+        self._timer.timeout.connect(self.pollEngine)
+        self._timer.start(100)
 
     def boardSize(self):
         # size of board in pixels
@@ -44,31 +65,81 @@ class tttScene(QGraphicsScene):
         return row * self._board._1Dsize + col
 
     def mousePressEvent(self, ev):
-        if ev.button() == QtCore.Qt.LeftButton:
+        if ev.button() == QtCore.Qt.LeftButton and not self._engineToMove:
             pos = ev.scenePos()
             cellID = self.cellAt(pos.x(), pos.y())
-            self.makeMove(cellID)
-            self.update()
-            # follows engine's play
-            mc = monteCarlo(self._board)
-            self.makeMove(mc.getMove())
+            if self.makeMove(cellID):
+                self.update()
+                # engine's play follows from engineLoop and pollEngine
+                self._engineToMove = not self._board.winner()
+                self._playerMoves.put((cellID, self._engineToMove))
+
+    def engineLoop(self):
+        """ body of the engine's worker thread. Re-roots the tree at every
+            move of the player and, when the engine is to reply, gets its
+            move, which only searches more if pondering has not reached
+            movePlayouts, makes it and re-roots again. The board is only
+            changed here while the engine is to move
+        """
+        while True:
+            move, reply = self._playerMoves.get()
+            if move is None:
+                break
+            self._engine.advance(move)
+            if not reply:
+                continue
+            move = self._engine.getMove()
+            side = self._board.currPlayer()
+            self._board.makeMove(move)
+            self._engine.advance(move)
+            self._engineMoves.put((move, side))
+
+    def stopEngine(self):
+        """ stops the worker thread and the pondering for good """
+        self._playerMoves.put((None, False))
+        self._engineThread.join()
+        self._engine.stopPondering()
+
+    def pollEngine(self):
+        """ publishes the progress of the engine's search and draws its move
+            once the worker thread has made it
+        """
+        playouts, best, share = self._engine.progress()
+        if self._engineToMove:
+            status = "Thinking: {0} playouts".format(playouts)
+        else:
+            status = "Pondering: {0} playouts".format(playouts)
+        if best is not None:
+            status += "\nbest {0} ({1:.0f}%)".format(best, 100*share)
+        self.statusChanged.emit(status)
+        try:
+            move, side = self._engineMoves.get_nowait()
+        except queue.Empty:
+            return
+        self.drawMove(move, side)
+        self.update()
+        self._engineToMove = False
 
     def makeMove(self, move):
         if move >= self._board._boardSize       or\
            move not in self._board.legalMoves() or\
            self._board.winner() > 0:
            # illegal move
-           return
+           return False
 
-        image = None
         sideToMove = self._board.currPlayer()
+        self._board.makeMove(move)
+        self.drawMove(move, sideToMove)
+        return True
+
+    def drawMove(self, move, sideToMove):
+        """ puts the mark of sideToMove on the cell of move """
+        image = None
         if sideToMove == 1:
             image = self._OImage
         if sideToMove == 2:
             image = self._XImage
 
-        self._board.makeMove(move)
-
         playerIcon = QGraphicsPixmapItem(QPixmap.fromImage(image))
         playerIcon.setScale(0.15)
         cellID = move
@@ -124,12 +195,21 @@ class tttGui:
         self._displayLabel = QLabel(self._mainWindow)
         self._displayLabel.setPixmap(logo);
 
+        # engine's search progress below the logo
+        self._statusLabel = QLabel(self._mainWindow)
+        self._graphicsScene.statusChanged.connect(self._statusLabel.setText)
+
         # create a layout
         layout = QHBoxLayout()
         layout.addWidget(self._graphicsView)
-        layout.addWidget(self._displayLabel)
+        sideLayout = QVBoxLayout()
+        sideLayout.addWidget(self._displayLabel)
+        sideLayout.addWidget(self._statusLabel)
+        layout.addLayout(sideLayout)
         self._mainWindow.setLayout(layout)
 
     def show(self):
         self._mainWindow.show()
-        sys.exit(self._app.exec_())
+        status = self._app.exec_()
+        self._graphicsScene.stopEngine()
+        sys.exit(status)
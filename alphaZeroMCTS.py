@@ -1,8 +1,12 @@
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
-import copy
 import numpy as np
 from random import choice
+from math import ceil
+from operator import itemgetter
+from searchBudget import searchBudget
+from transpositionTable import transpositionTable
+from evaluationCache import evaluationCache
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 class alphaZeroMCTS:
@@ -12,10 +16,7 @@ class alphaZeroMCTS:
         a : used for move a from position s
      """
     def __init__(self,board, network, *kargs, **kwds):
-        self._N_sa = {}
-        self._W_sa = {}
-        self._Q_sa = {}
-        self._P_sa = {}
+        self._table = self.newTable(**kwds)
         self._board = board
         self._network = network
         self._maxMoves = 10
@@ -24,7 +25,58 @@ class alphaZeroMCTS:
         self._pi = [0]*self._board._boardSize
         self._v = 0
         self._p = [0]*self._board._boardSize
+        # store statistics and network evaluations under the symmetry-canonical
+        # state, so that all symmetric copies of a position share them
+        self._canonical = kwds.get('canonical', False)
+        # store statistics under the zobrist hash of the state instead of the
+        # state string, which is cheaper to get and hash on large boards
+        self._zobrist = kwds.get('zobrist', False)
+        # progressive widening: only the k moves with the highest prior P_sa
+        # can be selected from a position, k growing with its visit count
+        # Ntotal as ceil(widenC * Ntotal**widenAlpha)
+        self._widening = kwds.get('widening', False)
+        self._widenC = kwds.get('widenC', 1)
+        self._widenAlpha = kwds.get('widenAlpha', 0.4)
+        # searchBudget limiting every search, by default _maxGameSim
+        # simulations
+        self._budget = kwds.get('budget')
+        if self._budget is None:
+            self._budget = searchBudget(simulations=self._maxGameSim)
+        # scratch board the simulations play on and roll back
+        self._simulationBoard = board.clone()
+        # batched search: simulations run batchSize at a time, their leaves
+        # evaluated together in one network call. virtualLoss is the number
+        # of lost visits put on the path of every pending leaf
+        self._batchSize = kwds.get('batchSize', 1)
+        self._virtualLoss = kwds.get('virtualLoss', 1)
+        # preallocated network input for leaf evaluation, one row per position
+        self._leafInput = np.zeros((self._batchSize,2*self._board._boardSize+1),dtype=np.float32)
+        # evaluationCache of the network outputs, by default the one shared by
+        # every searcher of the process. None to always call the network
+        self._evalCache = kwds.get('evalCache', evaluationCache.shared())
+        # dirichlet noise is only mixed into the priors of the moves of the
+        # root, keyed _rootKey. _rootPriors keeps their priors without noise
+        # as tuple of the root and a dictionary of prior by key move
+        self._rootKey = None
+        self._rootPriors = None
     
+    def newTable(self, **kwds):
+        """ returns the transpositionTable of the statistics, at most
+            maxEntries keys or about maxBytes bytes if given. All the moves
+            of a position s are evicted together, the least recent or least
+            visited positions first
+        """
+        table = transpositionTable(('N', 'W', 'Q', 'P'),
+                                   kwds.get('maxEntries'),
+                                   kwds.get('maxBytes'),
+                                   kwds.get('evict', 'recent'),
+                                   nodeOf=itemgetter(0))
+        self._N_sa = table.table('N')
+        self._W_sa = table.table('W')
+        self._Q_sa = table.table('Q')
+        self._P_sa = table.table('P')
+        return table
+
     def dirichletNoise(self, param, count):
         """ random number generator fitting to dirichlet noise
             https://en.wikipedia.org/wiki/Dirichlet_distribution
@@ -32,61 +84,240 @@ class alphaZeroMCTS:
         sample = [np.random.gamma(param, 1) for ii in range(count)]
         return [v / sum(sample) for v in sample]
 
-    def runSimulation(self):
-        """ runs a monte carlo tree search simulation and updates search
-            statistics
+    def noisy(self, priors):
+        """ returns list of priors mixed with dirichlet noise """
+        dnoise = self.dirichletNoise(0.03, len(priors))
+        eps = 0.25
+        return [(1 - eps)*prior + eps*noise for prior, noise in zip(priors, dnoise)]
+
+    def takeBackNoise(self):
+        """ puts back the priors without noise of the moves of the root """
+        if self._rootPriors is None:
+            return
+        s, priors = self._rootPriors
+        for ka, prior in priors.items():
+            if (s,ka) in self._P_sa:
+                self._P_sa[(s,ka)] = prior
+        self._rootPriors = None
+
+    def addRootNoise(self, s, keyMoves):
+        """ makes s the root and mixes fresh dirichlet noise into the priors
+            of its moves, taking back the noise of the previous root. If s is
+            not expanded yet the noise is added on expansion
+        """
+        self.takeBackNoise()
+        self._rootKey = s
+        if not keyMoves or not all((s,ka) in self._P_sa for a,ka in keyMoves):
+            return
+        priors = dict((ka, self._P_sa[(s,ka)]) for a,ka in keyMoves)
+        self._rootPriors = (s, priors)
+        for (a,ka), prior in zip(keyMoves, self.noisy([priors[ka] for a,ka in keyMoves])):
+            self._P_sa[(s,ka)] = prior
+
+    def advance(self, move):
+        """ moves the root to the position reached by move, once move has been
+            made on the board, as monteCarloTree.advance. The next search
+            starts there with the statistics gathered below it so far, as they
+            are kept by position
+        """
+        self.takeBackNoise()
+
+    def stateKey(self, board):
+        """ returns the key s of board position in the statistics tables and
+            a list of tuples (a, ka) of every legal move a and the move ka its
+            statistics are kept under. Unless canonical keys are used s is the
+            board state, or its zobrist hash, and ka is a
+        """
+        if self._canonical:
+            s, transform = board.canonicalize()
+            return s, [(a, board.toCanonicalMove(a, transform))
+                       for a in board.legalMoves()]
+        if self._zobrist:
+            return board.key(), [(a, a) for a in board.legalMoves()]
+        return board.getState(), [(a, a) for a in board.legalMoves()]
+
+    def edgeStats(self, s, keyMoves):
+        """ returns list of tuples (N, W, Q) of every move of keyMoves from
+            position s, zeros for the moves not in the tables
         """
-        visitedActions = set()
-        # should run this simulation on a copy so as not to corrupt the actual
-        # board by making moves on it
-        simulationBoard = copy.deepcopy(self._board)
-        simBoardState = simulationBoard.getState()
+        return [(self._N_sa.get((s,ka),0), self._W_sa.get((s,ka),0),
+                 self._Q_sa.get((s,ka),0)) for a,ka in keyMoves]
+
+    def selectLeaf(self):
+        """ descends from the root with the UCB formula till a position not
+            expanded yet or the end of the game. Returns the list of (s, a)
+            keys of the moves made and the leaf reached as a tuple of its key
+            s, its key moves and its state, None if the game ended or
+            _maxMoves were made. The scratch board is left as it was
+        """
+        path = []
+        leaf = None
+        # moves are made on the scratch board so as not to corrupt the actual
+        # board, and taken back once the leaf is found
+        simulationBoard = self._simulationBoard
+        movesMade = 0
         Q,N = self._Q_sa,self._N_sa
 
         for t in range(self._maxMoves):
-            legalMoves = simulationBoard.legalMoves()
+            simBoardState, keyMoves = self.stateKey(simulationBoard)
             #stop if no legal moves
-            if len(legalMoves) == 0:
+            if len(keyMoves) == 0:
                 break
             # check if node has been expanded
-            if  all(N.get((simBoardState,a)) for a in legalMoves):
+            if  (self._table.lookup((simBoardState,keyMoves[0][1])) and
+                 all(N.get((simBoardState,ka)) for a,ka in keyMoves)):
                  #use the UCB formula
-                Ntotal = sum(filter(None,(N.get((simBoardState, a)) for a in legalMoves)))
+                Ntotal = sum(filter(None,(N.get((simBoardState, ka)) for a,ka in keyMoves)))
                 logNtotal = np.log(Ntotal)
-                ucbVal, move= max( ( Q[(simBoardState,a)]
-                + self._ucbK*np.sqrt(logNtotal/N[(simBoardState,a)]),a) for a in legalMoves)
-                visitedActions.add((simBoardState,move))
+                if self._widening:
+                    k = int(ceil(self._widenC * Ntotal**self._widenAlpha))
+                    keyMoves = sorted(keyMoves, key=lambda aka:
+                                      -self._P_sa[(simBoardState,aka[1])])[:k]
+                ucbVal, keyMove, move= max( ( Q[(simBoardState,ka)]
+                + self._ucbK*np.sqrt(logNtotal/N[(simBoardState,ka)]),ka,a) for a,ka in keyMoves)
+                # touched on the way down, so that expanding the leaf cannot
+                # evict the path
+                self._table.touch((simBoardState,keyMove))
+                path.append((simBoardState,keyMove))
             else:
-                s = np.zeros((2*self._board._1Dsize**2+1,1))
-                s[:,0] = self._board.decodeState(simBoardState)
-                netPredict = self._network.predict(s)
-                self._p = netPredict[0][:,0]
-                self._v = netPredict[1][:,0][0]
-                dnoise = self.dirichletNoise(0.03, len(legalMoves))
-                eps = 0.25
-                moveIndex = 0
-                for a in legalMoves:
-                    self._N_sa[(simBoardState,a)]=0
-                    self._Q_sa[(simBoardState,a)]=0
-                    self._W_sa[(simBoardState,a)]=0
-                    self._P_sa[(simBoardState,a)]=(1 - eps)*self._p[a] + eps*dnoise[moveIndex]
-                    visitedActions.add((simBoardState,a))
-                    moveIndex+=1
+                if self._zobrist:
+                    leafState = simulationBoard.getState()
+                else:
+                    leafState = simBoardState
+                leaf = (simBoardState, keyMoves, leafState)
                 break
                 
             simulationBoard.makeMove(move)
-            simBoardState  = simulationBoard.getState()
+            movesMade += 1
             winner = simulationBoard.winner()
             if winner:
                 break
 
-        for simBoardState, move in visitedActions:
-            if (simBoardState,move) not in self._N_sa:
+        for t in range(movesMade):
+            simulationBoard.unmakeMove()
+        return path, leaf
+
+    def expandLeaf(self, leaf, p):
+        """ adds the moves of leaf to the tables, with the network prior p,
+            mixed with dirichlet noise at the root, and returns their keys
+        """
+        simBoardState, keyMoves, leafState = leaf
+        priors = [p[ka] for a,ka in keyMoves]
+        if simBoardState == self._rootKey:
+            self._rootPriors = (simBoardState,
+                                dict((ka, prior) for (a,ka), prior in zip(keyMoves, priors)))
+            priors = self.noisy(priors)
+        children = []
+        for (a,ka), prior in zip(keyMoves, priors):
+            self._table.add((simBoardState,ka), 0, 0, 0, prior)
+            children.append((simBoardState,ka))
+        return children
+
+    def backup(self, path, v):
+        """ counts a visit of value v for every key of path """
+        for key in path:
+            if key not in self._N_sa:
+                continue
+            self._N_sa[key] += 1
+            self._W_sa[key] += v
+            self._Q_sa[key] = self._W_sa[key]/self._N_sa[key]
+
+    def addVirtualLoss(self, path, loss):
+        """ counts loss visits of value -1 for every key of path, so that the
+            next descents of a batch turn to other moves. Taken back with
+            -loss
+        """
+        for key in path:
+            if key not in self._N_sa:
                 continue
-            self._N_sa[(simBoardState, move)] += 1
-            self._W_sa[(simBoardState,move)] += self._v
-#            print(self._v)
-            self._Q_sa[(simBoardState, move)] = self._W_sa[(simBoardState,move)]/self._N_sa[(simBoardState,move)]
+            self._N_sa[key] += loss
+            self._W_sa[key] -= loss
+            self._Q_sa[key] = self._W_sa[key]/self._N_sa[key]
+
+    def evaluate(self, leafStates):
+        """ returns list of the policy p and value v of the network for every
+            state of leafStates, from the evaluation cache for the states
+            found there and from a single network call for the others
+        """
+        cache = self._evalCache
+        evaluations = [None]*len(leafStates)
+        missing = []
+        if cache is not None:
+            owner = cache.owner(self._network)
+        for ii, state in enumerate(leafStates):
+            if cache is not None:
+                evaluations[ii] = cache.lookup(owner, state)
+            if evaluations[ii] is None:
+                missing.append(ii)
+        if missing:
+            if len(missing) > len(self._leafInput):
+                # leaves of several searchers, see searchTogether
+                self._leafInput = np.zeros((len(missing), self._leafInput.shape[1]),
+                                           dtype=np.float32)
+            leafInput = self._leafInput[:len(missing)]
+            self._board.decodeStates([leafStates[ii] for ii in missing], out=leafInput)
+            # network takes one column per position
+            netPredict = self._network.predict(leafInput.T)
+            for column, ii in enumerate(missing):
+                evaluations[ii] = (netPredict[0][:,column], netPredict[1][0,column])
+                if cache is not None:
+                    cache.add(owner, leafStates[ii], *evaluations[ii])
+        return evaluations
+
+    def runSimulation(self):
+        """ runs a monte carlo tree search simulation and updates search
+            statistics
+        """
+        self._table.tick()
+        path, leaf = self.selectLeaf()
+        if leaf is not None:
+            self._p, self._v = self.evaluate([leaf[2]])[0]
+            path += self.expandLeaf(leaf, self._p)
+        self.backup(path, self._v)
+
+    def runBatch(self, count):
+        """ runs up to count simulations whose leaves are evaluated by a
+            single network call. Every descent puts a virtual loss on its
+            path so that the next one ends at another leaf, descents ending
+            at a leaf already in the batch are dropped, at most 2*count of
+            them. Returns the number of simulations run
+        """
+        batch, simulations = self.selectBatch(count)
+        if batch:
+            self.expandBatch(batch, self.evaluate([leaf[2] for path, leaf in batch]))
+        return simulations
+
+    def selectBatch(self, count):
+        """ first half of runBatch, the descents. Returns the list of tuples
+            of the path and leaf of every descent to evaluate and the number
+            of simulations run
+        """
+        self._table.tick()
+        batch = []
+        leafKeys = set()
+        simulations = 0
+        for attempt in range(2*count):
+            if simulations == count:
+                break
+            path, leaf = self.selectLeaf()
+            if leaf is None:
+                # game over, nothing to evaluate
+                self.backup(path, self._v)
+                simulations += 1
+            elif leaf[0] not in leafKeys:
+                self.addVirtualLoss(path, self._virtualLoss)
+                leafKeys.add(leaf[0])
+                batch.append((path, leaf))
+                simulations += 1
+        return batch, simulations
+
+    def expandBatch(self, batch, evaluations):
+        """ second half of runBatch, takes back the virtual losses of batch
+            and expands and backs up its leaves with their evaluations
+        """
+        for (path, leaf), (self._p, self._v) in zip(batch, evaluations):
+            self.addVirtualLoss(path, -self._virtualLoss)
+            self.backup(path + self.expandLeaf(leaf, self._p), self._v)
 
     def getMCTSMoveProbs(self,tau=0):
         """ returns  the vector pi of move probability at each move
@@ -94,23 +325,150 @@ class alphaZeroMCTS:
             tau is a parameter which determines whether max move is returned (tau=0)
             or whether a proportional probability is returned (tau = 1)
         """
-        legalMoves = self._board.legalMoves()
-        boardState = self._board.getState()
-        # no need to run simulation if there are no real choices
-        # so return accordingly
-        games = 0
-        while games < self._maxGameSim:
-            self.runSimulation()
-            games+=1
-        prob, move = max((self._Q_sa[(boardState,a)], a) for a in legalMoves)
+        self.startSearch()
+        if self._batchSize > 1:
+            # the budget grants up to batchSize simulations at a time
+            count = self.granted()
+            while count:
+                self._budget.consume(self.runBatch(count))
+                count = self.granted()
+        else:
+            while self.granted():
+                self.runSimulation()
+        return self.finishSearch()
+
+    def startSearch(self):
+        """ sets up the search of getMCTSMoveProbs from the position of the
+            board, its root, and starts the budget
+        """
+        self._pi = [0]*self._board._boardSize
+        self._simulationBoard = self._board.clone()
+        boardState, keyMoves = self.stateKey(self._board)
+        self.addRootNoise(boardState, keyMoves)
+        self._search = (boardState, keyMoves)
+        self._table.pin([boardState])
+        self._reused = sum(self.rootVisits())
+        self._budget.start()
+
+    def rootVisits(self):
+        """ returns the visit counts of the moves of the root """
+        boardState, keyMoves = self._search
+        return [N for N, W, Q in self.edgeStats(boardState, keyMoves)]
+
+    def granted(self):
+        """ returns the number of simulations the budget grants next, up to
+            batchSize. A single simulation is charged already, larger
+            counts are charged with consume once run
+        """
+        count = self._budget.running(len(self._table), self.rootVisits, self._batchSize)
+        return int(count)
+
+    def finishSearch(self):
+        """ returns the vector pi of getMCTSMoveProbs from the statistics of
+            the root
+        """
+        boardState, keyMoves = self._search
+        reused = self._reused
+        stats = self.edgeStats(boardState, keyMoves)
+        if self._widening or self._budget.stopsEarly():
+            # moves left out by widening keep the single visit of expansion
+            # and a noisy Q, and an early stop only guarantees the most
+            # visited move stays on top, so the most visited move is played
+            visits, move = max((N, a) for (N, W, Q), (a, ka) in zip(stats, keyMoves))
+        else:
+            prob, move = max((Q, a) for (N, W, Q), (a, ka) in zip(stats, keyMoves))
         self._pi[move] = 1
-        self.printStats(boardState,legalMoves)
+        self.printStats(boardState,keyMoves)
+        print("Visits reused from previous moves: ", reused)
+        print(self._table.report())
+        if self._evalCache is not None:
+            print(self._evalCache.report())
         return self._pi
 
-    def printStats(self,state,legalMoves):
-        for x in sorted(((self._Q_sa[(state,a)],
-                          self._W_sa[(state,a)],
-                          self._N_sa[(state,a)],a)
-                            for a in legalMoves),
+    @classmethod
+    def searchTogether(cls, searchers):
+        """ runs getMCTSMoveProbs of every searcher of searchers, which share
+            one network, side by side. Each round every searcher makes the
+            descents its budget grants and the leaves of all of them are
+            evaluated by a single network call. Returns the list of their pi
+        """
+        for searcher in searchers:
+            searcher.startSearch()
+        while True:
+            batches = []
+            for searcher in searchers:
+                count = searcher.granted()
+                if count:
+                    batch, simulations = searcher.selectBatch(count)
+                    if searcher._batchSize > 1:
+                        searcher._budget.consume(simulations)
+                    batches.append((searcher, batch))
+            if not batches:
+                break
+            evaluations = searchers[0].evaluate([leaf[2] for searcher, batch in batches
+                                                 for path, leaf in batch])
+            for searcher, batch in batches:
+                searcher.expandBatch(batch, evaluations[:len(batch)])
+                evaluations = evaluations[len(batch):]
+        return [searcher.finishSearch() for searcher in searchers]
+
+    def printStats(self,state,keyMoves):
+        for x in sorted(((Q, W, N, a) for (N, W, Q), (a, ka) in
+                            zip(self.edgeStats(state, keyMoves), keyMoves)),
                             reverse=True) :
-print("{3}: Q {0:.2f} W {1:.2f} N {2}".format(*x))
\ No newline at end of file
+            print("{3}: Q {0:.2f} W {1:.2f} N {2}".format(*x))
+
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    # benchmark simulations per second against the batch size. The stand-in
+    # network is a small numpy net which, like a keras predict call, pays a
+    # fixed overhead per call whatever the number of positions
+    import time
+    from tttBoard import tttBoard
+    class overheadNetwork:
+        def __init__(self, boardSize, overhead=0.002, hidden=64):
+            self._overhead = overhead
+            self._W1 = np.random.randn(hidden, 2*boardSize + 1)*0.1
+            self._Wp = np.random.randn(boardSize, hidden)*0.1
+            self._Wv = np.random.randn(1, hidden)*0.1
+        def predict(self, x):
+            time.sleep(self._overhead)
+            h = np.maximum(self._W1.dot(x), 0)
+            p = np.exp(self._Wp.dot(h))
+            return p / p.sum(axis=0), np.tanh(self._Wv.dot(h))
+    for n in (3, 5):
+        board = tttBoard(n)
+        network = overheadNetwork(n*n)
+        for batchSize in (1, 4, 16, 64):
+            searcher = alphaZeroMCTS(board, network, batchSize=batchSize,
+                                     evalCache=None)
+            searcher._maxMoves = n*n
+            count = 0
+            begin = time.perf_counter()
+            while time.perf_counter() - begin < 1:
+                if batchSize > 1:
+                    count += searcher.runBatch(batchSize)
+                else:
+                    searcher.runSimulation()
+                    count += 1
+            elapsed = time.perf_counter() - begin
+            print("{0}x{0} batchSize {1:>2}: {2:.0f} simulations/s".format(
+                n, batchSize, count / elapsed))
+    # hit rate of the shared evaluation cache over 3x3 self-play, a new
+    # searcher for every move as in alphaZeroTrain_RL
+    network = overheadNetwork(9, overhead=0)
+    cache = evaluationCache.shared()
+    for games in range(5):
+        for game in range(20):
+            board = tttBoard(3)
+            board.makeMove(choice(board.legalMoves()))
+            while not board.winner() and board.legalMoves():
+                searcher = alphaZeroMCTS(board, network)
+                for sim in range(50):
+                    searcher.runSimulation()
+                boardState, keyMoves = searcher.stateKey(board)
+                stats = searcher.edgeStats(boardState, keyMoves)
+                visits, move = max((N, a) for (N, W, Q), (a, ka) in zip(stats, keyMoves))
+                board.makeMove(move)
+        print("games {0:>3}: {1}".format(20*(games + 1), cache.report()))
@@ -1,86 +1,76 @@
-from alphaZeroMCTS_SL import alphaZeroMCTS
+from alphaZeroMCTS import alphaZeroMCTS
 from tttBoard import tttBoard
+from batchBoard import batchBoard
 #from convNeuralNetwork import cnNetwork
 from deepNeuralNetwork import dnNetwork
+from evaluationCache import evaluationCache
 import numpy as np
 
 board1DSize = 3
 gamesTrainBatch = 1000
+# games played side by side, their searchers alive together
+gamesInParallel = 100
 totalBatches =1
 #brain = cnNetwork(inputShape=(board1DSize,board1DSize,7),
 #                  outputSize=board1DSize*board1DSize+1)
 board = tttBoard(3)
 brain = dnNetwork(2*board1DSize*board1DSize+1,board1DSize*board1DSize+1)
-def gameOver(board):
-    if (board.winner()):
-        if(board.winner()==1):
-            return 1
-        elif(board.winner()==2):
-            return 1
-        elif(board.winner()==-1):
-            return 1
-    else:
-        return 0
-
 def playGame(brain,TotalGames):
-    games = 0
-    allStates = []
+    # games are played side by side, gamesInParallel at a time. The searches
+    # of a move of all the running games go together, so that their leaves
+    # are evaluated by one network call, and the batch keeps the positions
+    # of the games to find the finished ones
+    playedStates = []
     allPiLabels = []
     allZLabels = []
-    while games < TotalGames:
-        print(games)
-        playedMoves = {}
-        board = tttBoard(board1DSize)
+    for first in range(0,TotalGames,gamesInParallel):
+        count = min(gamesInParallel,TotalGames - first)
+        games = batchBoard(board1DSize,count)
+        boards = [tttBoard(board1DSize) for ii in range(count)]
+        # one searcher per game, for the whole game, so that the statistics
+        # of the positions below the move played are reused by the next search
+        searchers = [alphaZeroMCTS(boards[ii],brain) for ii in range(count)]
+        playedMoves = [{} for ii in range(count)]
+        winners = games.winners()
         nMoves = 0
-#        brain.loadModel()
-        while len(board.legalMoves()) > 0:
-            state = board.getState()
-#            print("state ",state)
-            alphaZeroTTT = alphaZeroMCTS(board,brain)
-            pi = alphaZeroTTT.getMCTSMoveProbs()
-            playedMoves[state] = pi
-#            print("pi ", pi)
-            board.makeMove(np.argmax(pi))
-#            print("move ",np.argmax(pi))
-#            board.display()
+        while (winners == 0).any():
+            print(first,nMoves)
+            active = winners == 0
+            running = np.flatnonzero(active)
+            pis = alphaZeroMCTS.searchTogether([searchers[ii] for ii in running])
+            moves = np.zeros(count,dtype=int)
+            for ii, pi in zip(running, pis):
+                playedMoves[ii][boards[ii].getState()] = pi
+#                print("pi ", pi)
+                moves[ii] = np.argmax(pi)
+                boards[ii].makeMove(moves[ii])
+                searchers[ii].advance(moves[ii])
+#                boards[ii].display()
+            games.makeMoves(moves,active)
+            winners = games.winners()
             nMoves += 1
-            if gameOver(board):
-                games += 1
-                winner = board.winner()
-                if winner == 1:     # O is winner
-                    z = 1
-                elif winner == -1:  # draw
-                    z = 0
-                else:               # X is winner
-                    assert(winner == 2)
-                    z = -1
-                break
-        ind = 0
-        piLabel = np.zeros((board1DSize*board1DSize,nMoves))
-        ZLabel = np.zeros((1,nMoves))
-        states = np.zeros((2*board1DSize*board1DSize+1,nMoves))
-#        statesCNN = np.zeros((nMoves,board1DSize,board1DSize,7))
-        for state in playedMoves:
-            pi = playedMoves[state]
-            #define the training data structure here,           
-#            statesCNN[ind] = np.float32(board.decodeStateCNN(board._stateHistory))
-            states[:,ind] = board.decodeState(state)
-            piLabel[:,ind] = pi
-            ZLabel[:,ind] = z
-            ind+=1
-        
-        allStates.append(states)
-        allPiLabels.append(piLabel)
-        allZLabels.append(ZLabel)
-    allStates = np.concatenate(allStates,axis=1)
-    allPiLabels = np.concatenate(allPiLabels,axis=1)
-    allZLabels = np.concatenate(allZLabels,axis=1)
+        # O is winner: 1, X is winner: -1, draw: 0
+        zs = np.where(winners == 1, 1, np.where(winners == 2, -1, 0))
+        for ii in range(count):
+            for state in playedMoves[ii]:
+                playedStates.append(state)
+                allPiLabels.append(playedMoves[ii][state])
+                allZLabels.append(zs[ii])
+    #define the training data structure here, one column per played state
+#    statesCNN = boards[0].decodeStatesCNN(playedHistories)
+    allStates = np.zeros((len(playedStates),2*board1DSize*board1DSize+1),dtype=np.float32)
+    boards[0].decodeStates(playedStates,out=allStates)
+    allStates = allStates.T
+    allPiLabels = np.array(allPiLabels).T
+    allZLabels = np.array(allZLabels).reshape(1,-1)
     return allStates, allPiLabels, allZLabels
         
 for ii in range(totalBatches):
     print(ii)
 #    brain.loadWeights()
     inp,pi,z = playGame(brain,gamesTrainBatch)
+    # searchers of every move share the network evaluations
+    print(evaluationCache.shared().report())
     np.savetxt("trainX.txt",inp, fmt='%2d', delimiter=',', newline='\n')
     np.savetxt("trainYPi.txt",pi, fmt='%2d', delimiter=',', newline='\n')
     np.savetxt("trainYZ.txt",z, fmt='%2d', delimiter=',', newline='\n')
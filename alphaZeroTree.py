@@ -0,0 +1,246 @@
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+import numpy as np
+from math import ceil, log
+from alphaZeroMCTS import alphaZeroMCTS
+from transpositionTable import transpositionTable
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+class alphaZeroTree(alphaZeroMCTS):
+    """ alphaZeroMCTS with the statistics of the moves kept in an arena: one
+        numpy column each for N, W, Q and P, the moves of a position in one
+        contiguous block, highest prior first. A position s only maps to its
+        block in the transposition table, so selection is one vectorized
+        argmax over the block and backup updates all the moves of a path at
+        once. maxEntries counts positions here, not moves. Blocks of evicted
+        positions are reclaimed by compacting the arena once they take half
+        of it
+    """
+    def newTable(self, **kwds):
+        """ returns the transpositionTable of the positions, holding their
+            visit count and the first move and number of moves of their block
+        """
+        table = transpositionTable(('N', 'first', 'count'),
+                                   kwds.get('maxEntries'),
+                                   kwds.get('maxBytes'),
+                                   kwds.get('evict', 'recent'))
+        self._nodeVisits = table.table('N')
+        self._first = table.table('first')
+        self._count = table.table('count')
+        capacity = kwds.get('capacity', 1024)
+        self._N = np.zeros(capacity, dtype=np.int32)
+        self._W = np.zeros(capacity)
+        self._Q = np.zeros(capacity)
+        self._P = np.zeros(capacity)
+        self._move = np.zeros(capacity, dtype=np.int16)
+        self._size = 0
+        self._collectAt = capacity
+        return table
+
+    def newMoves(self, count):
+        """ appends count moves to the arena and returns the index of the
+            first one
+        """
+        first = self._size
+        self._size += count
+        if self._size > len(self._N):
+            self.grow(max(self._size, 2*len(self._N)))
+        return first
+
+    def grow(self, capacity):
+        """ reallocates every column with room for capacity moves """
+        for name in ('_N', '_W', '_Q', '_P', '_move'):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def collect(self):
+        """ compacts the arena if blocks of evicted positions take half of
+            it. Only called between simulations, as it moves the blocks
+        """
+        if self._size <= self._collectAt:
+            return
+        live = sum(self._count.values())
+        if 2*live <= self._size:
+            blocks = [np.arange(first, first + self._count[s])
+                      for s, first in self._first.items()]
+            order = np.concatenate(blocks) if blocks else np.zeros(0, dtype=int)
+            for name in ('_N', '_W', '_Q', '_P', '_move'):
+                column = getattr(self, name)
+                column[:live] = column[order]
+            first = 0
+            for s in self._first:
+                self._first[s] = first
+                first += self._count[s]
+            self._size = live
+        self._collectAt = max(2*live, 1024)
+
+    def edgeStats(self, s, keyMoves):
+        if s not in self._first:
+            return [(0, 0, 0)]*len(keyMoves)
+        first = self._first[s]
+        edges = dict(zip(self._move[first:first + self._count[s]].tolist(),
+                         range(first, first + self._count[s])))
+        return [(int(self._N[edges[ka]]), self._W[edges[ka]], self._Q[edges[ka]])
+                if ka in edges else (0, 0, 0) for a,ka in keyMoves]
+
+    def selectLeaf(self):
+        """ as alphaZeroMCTS.selectLeaf, the keys of the path being tuples of
+            the position s and the arena index of the move made
+        """
+        path = []
+        leaf = None
+        simulationBoard = self._simulationBoard
+        movesMade = 0
+
+        for t in range(self._maxMoves):
+            if self._canonical:
+                s, transform = simulationBoard.canonicalize()
+            elif self._zobrist:
+                s = simulationBoard.key()
+            else:
+                s = simulationBoard.getState()
+            if not self._table.lookup(s):
+                s, keyMoves = self.stateKey(simulationBoard)
+                #stop if no legal moves
+                if len(keyMoves) == 0:
+                    break
+                leafState = simulationBoard.getState() if self._zobrist else s
+                leaf = (s, keyMoves, leafState)
+                break
+            self._table.touch(s)
+            first = self._first[s]
+            end = first + self._count[s]
+            N = self._N[first:end]
+            Ntotal = int(N.sum())
+            if self._widening:
+                end = min(end, first + int(ceil(self._widenC * Ntotal**self._widenAlpha)))
+                N = self._N[first:end]
+            #use the UCB formula
+            ucb = self._Q[first:end] + self._ucbK*np.sqrt(log(Ntotal)/N)
+            edge = first + int(ucb.argmax())
+            path.append((s, edge))
+            move = int(self._move[edge])
+            if self._canonical:
+                move = simulationBoard.fromCanonicalMove(move, transform)
+
+            simulationBoard.makeMove(move)
+            movesMade += 1
+            winner = simulationBoard.winner()
+            if winner:
+                break
+
+        for t in range(movesMade):
+            simulationBoard.unmakeMove()
+        return path, leaf
+
+    def sortBlock(self, s):
+        """ puts the moves of the block of s in order of prior, highest
+            first. Only called between simulations, as it moves them
+        """
+        first = self._first[s]
+        end = first + self._count[s]
+        order = first + np.argsort(-self._P[first:end], kind='stable')
+        for name in ('_N', '_W', '_Q', '_P', '_move'):
+            column = getattr(self, name)
+            column[first:end] = column[order]
+
+    def takeBackNoise(self):
+        if self._rootPriors is None:
+            return
+        s, priors = self._rootPriors
+        self._rootPriors = None
+        if s not in self._first:
+            return
+        first = self._first[s]
+        end = first + self._count[s]
+        self._P[first:end] = [priors[ka] for ka in self._move[first:end].tolist()]
+        self.sortBlock(s)
+
+    def addRootNoise(self, s, keyMoves):
+        self.takeBackNoise()
+        self._rootKey = s
+        if s not in self._first:
+            return
+        first = self._first[s]
+        end = first + self._count[s]
+        self._rootPriors = (s, dict(zip(self._move[first:end].tolist(),
+                                        self._P[first:end].tolist())))
+        self._P[first:end] = self.noisy(self._P[first:end].tolist())
+        self.sortBlock(s)
+
+    def expandLeaf(self, leaf, p):
+        """ adds the block of leaf to the arena, sorted by prior """
+        s, keyMoves, leafState = leaf
+        count = len(keyMoves)
+        keys = np.array([ka for a,ka in keyMoves])
+        prior = np.asarray(p)[keys]
+        if s == self._rootKey:
+            self._rootPriors = (s, dict(zip(keys.tolist(), prior.tolist())))
+            prior = np.array(self.noisy(prior.tolist()))
+        order = np.argsort(-prior, kind='stable')
+        first = self.newMoves(count)
+        end = first + count
+        self._N[first:end] = 0
+        self._W[first:end] = 0
+        self._Q[first:end] = 0
+        self._P[first:end] = prior[order]
+        self._move[first:end] = keys[order]
+        self._table.add(s, 0, first, count)
+        return [(s, edge) for edge in range(first, end)]
+
+    def backup(self, path, v):
+        edges = []
+        for s, edge in path:
+            if s not in self._nodeVisits:
+                continue
+            self._nodeVisits[s] += 1
+            edges.append(edge)
+        self._N[edges] += 1
+        self._W[edges] += v
+        self._Q[edges] = self._W[edges]/self._N[edges]
+
+    def addVirtualLoss(self, path, loss):
+        edges = []
+        for s, edge in path:
+            if s not in self._nodeVisits:
+                continue
+            edges.append(edge)
+        self._N[edges] += loss
+        self._W[edges] -= loss
+        self._Q[edges] = self._W[edges]/self._N[edges]
+
+    def runSimulation(self):
+        self.collect()
+        alphaZeroMCTS.runSimulation(self)
+
+    def selectBatch(self, count):
+        self.collect()
+        return alphaZeroMCTS.selectBatch(self, count)
+
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    # benchmark simulations per second against the dict based alphaZeroMCTS.
+    # The network gives random priors and values at no cost, so that only
+    # the search itself is timed
+    import time
+    from tttBoard import tttBoard
+    class randomNetwork:
+        def predict(self, x):
+            p = np.random.rand(x.shape[0] // 2, x.shape[1])
+            return p / p.sum(axis=0), 2*np.random.rand(1, x.shape[1]) - 1
+    for n, k in ((3, 3), (9, 5)):
+        board = tttBoard(n, k)
+        for searcherClass in (alphaZeroMCTS, alphaZeroTree):
+            searcher = searcherClass(board, randomNetwork(), evalCache=None)
+            searcher._maxMoves = n*n
+            count = 0
+            begin = time.perf_counter()
+            while time.perf_counter() - begin < 2:
+                searcher.runSimulation()
+                count += 1
+            elapsed = time.perf_counter() - begin
+            print("{0}x{0} {1}: {2:.0f} simulations/s, {3} table entries".format(
+                n, searcherClass.__name__, count / elapsed, len(searcher._table)))
@@ -0,0 +1,127 @@
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+import numpy as np
+from tttBoard import tttBoard
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+class batchBoard:
+    """ a batch of B tic tac toe games played side by side. Game b is row b of
+        a (B, n*n) array holding 0, 1 or 2 for empty, O or X, indexed like
+        tttBoard. Every method works on all games at once with numpy, so the
+        cost of a move or a win check is shared by the whole batch
+    """
+    def __init__(self, n, batchSize, k=None, rows=None):
+        rows = n if rows is None else rows
+        self._1Dsize = n
+        self._boardSize = rows*n
+        self._batchSize = batchSize
+        self._board = np.zeros((batchSize, rows*n), dtype=np.int8)
+        self._numMoves = np.zeros(batchSize, dtype=np.int32)
+        self._rows = np.arange(batchSize)
+        # column l of the line matrix has 1 on the squares of win line l, so
+        # (playerBoard @ lineMatrix)[b,l] counts player's marks on line l.
+        # float32 so that the products go through BLAS
+        lines = tttBoard.winLines(n, k, rows=rows)[0]
+        self._k = n if k is None else k
+        self._lineMatrix = np.zeros((rows*n, len(lines)), dtype=np.float32)
+        for l, line in enumerate(lines):
+            for ii in range(rows*n):
+                if (line >> ii) & 1:
+                    self._lineMatrix[ii, l] = 1
+
+    def reset(self):
+        """ clears every game in the batch """
+        self._board[:] = 0
+        self._numMoves[:] = 0
+
+    def loadBoard(self, board, games=None):
+        """ copies the position of tttBoard board into the passed games, all
+            of them by default
+        """
+        if games is None:
+            games = self._rows
+        state = np.frombuffer(board.getState().encode(), dtype=np.uint8)
+        self._board[games] = state - ord('0')
+        self._numMoves[games] = np.count_nonzero(state - ord('0'))
+
+    def legalMask(self):
+        """ returns a (B, n*n) boolean array, True at the empty squares """
+        return self._board == 0
+
+    def currPlayers(self):
+        """ returns player to move in each game, 1 for O and 2 for X """
+        return 1 + self._numMoves % 2
+
+    def makeMoves(self, moves, active=None):
+        """ plays moves[b] in game b for the side to move. active is an
+            optional boolean mask, games where it is False are left alone
+        """
+        moves = np.asarray(moves)
+        rows = self._rows if active is None else np.flatnonzero(active)
+        moves = moves[rows]
+        assert((self._board[rows, moves] == 0).all())
+        self._board[rows, moves] = 1 + self._numMoves[rows] % 2
+        self._numMoves[rows] += 1
+
+    def winners(self, games=None):
+        """ returns winner of each game like tttBoard.winner: 1 or 2 if O or X
+            completed a line, -1 for a draw and 0 if the game is still on.
+            games optionally selects the rows to check
+        """
+        board = self._board if games is None else self._board[games]
+        numMoves = self._numMoves if games is None else self._numMoves[games]
+        Ocount = (board == 1).astype(np.float32) @ self._lineMatrix
+        Xcount = (board == 2).astype(np.float32) @ self._lineMatrix
+        winners = np.zeros(len(board), dtype=np.int8)
+        winners[numMoves == self._boardSize] = -1
+        winners[(Xcount == self._k).any(axis=1)] = 2
+        winners[(Ocount == self._k).any(axis=1)] = 1
+        return winners
+
+    def randomPlayouts(self):
+        """ plays every unfinished game to the end with uniformly random moves
+            and returns the winners
+        """
+        winners = self.winners()
+        games = np.flatnonzero(winners == 0)
+        while len(games):
+            # random priority for each empty square, the highest is played
+            board = self._board[games]
+            priorities = np.random.random_sample(board.shape)
+            priorities[board != 0] = -1
+            moves = np.argmax(priorities, axis=1)
+            self._board[games, moves] = 1 + self._numMoves[games] % 2
+            self._numMoves[games] += 1
+            # only the games still on need to be checked again
+            gameWinners = self.winners(games)
+            winners[games] = gameWinners
+            games = games[gameWinners == 0]
+        return winners
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # benchmark random playouts per second from the empty board, one tttBoard
+    # at a time against batches of growing width
+    import time
+    from random import choice
+    for n in (3, 7):
+        count = 0
+        begin = time.perf_counter()
+        while time.perf_counter() - begin < 1:
+            board = tttBoard(n)
+            while not board.winner():
+                board.makeMove(choice(board.legalMoves()))
+            count += 1
+        elapsed = time.perf_counter() - begin
+        print("{0}x{0} tttBoard: {1:.0f} playouts/s".format(n, count / elapsed))
+        for batchSize in (64, 1024, 8192):
+            games = batchBoard(n, batchSize)
+            count = 0
+            begin = time.perf_counter()
+            while time.perf_counter() - begin < 1:
+                games.reset()
+                games.randomPlayouts()
+                count += batchSize
+            elapsed = time.perf_counter() - begin
+            print("{0}x{0} batchBoard({1}): {2:.0f} playouts/s".format(n, batchSize, count / elapsed))
@@ -46,6 +46,10 @@ class cnNetwork():
                       loss='categorical_crossentropy',
                       metrics=['accuracy'])
         self._epochSize = 128
+        # bumped by train, saveModel and loadModel. evaluationCache keys the
+        # evaluations by it, so those of older weights are no longer found
+        # and age out of the cache
+        self._weightVersion = 0
         
     def loss(self,yTrue,yPred):
         z = keras.backend.flatten(yTrue[-1])
@@ -60,20 +64,28 @@ class cnNetwork():
         """ Load the network parameters from a file
         """
         self._model.load_weights('my_cnn_model')
+        self._weightVersion += 1
         return None
 
     def saveModel(self):
         """ Save the network parameters to a file
         """
         self._model.save_weights('./my_cnn_model')
+        self._weightVersion += 1
         return None
 
     def train(self, train_x,train_y):
         """ Train the network using passed training data as numpy array
         """
         self._model.fit(train_x,train_y,batch_size=8,epochs = self._epochSize)
+        self._weightVersion += 1
         return None
     
+    def weightVersion(self):
+        """ returns a number which changes whenever the weights change
+        """
+        return self._weightVersion
+
     def predict(self,x):
         """Predict the output, given input
         """
@@ -98,12 +110,12 @@ if __name__ == "__main__":
 #    states[0,:] = board.decodeState(board.getState())
 #    print(states)
 #    print(testNet.predict(states))
-    result = testNet.predict(board.decodeStateCNN(board._stateHistory))
+    result = testNet.predict(board.decodeStateCNN(board.stateHistory()))
     print(result[0].flatten())
 #    print(result[1].flatten())
     print(np.argmax(result[0].flatten()))
     board.makeMove(7)
-    result = testNet.predict(board.decodeStateCNN(board._stateHistory))
+    result = testNet.predict(board.decodeStateCNN(board.stateHistory()))
     print(result[0].flatten())
 #    print(result[1].flatten())
     print(np.argmax(result[0].flatten()))
@@ -11,6 +11,10 @@ class dNNTF():
         self._inputSize = 2*board1DSize*board1DSize+1
         self._outPiSize= board1DSize*board1DSize
         self._parameters = self.initializeParameters()
+        # bumped by train, saveModel and loadModel. evaluationCache keys the
+        # evaluations by it, so those of older weights are no longer found
+        # and age out of the cache
+        self._weightVersion = 0
     def createPlaceholders(self):
         x = tf.placeholder(tf.float32,shape=(self._inputSize,None),name="x")
         yPi = tf.placeholder(tf.float32,shape=(self._outPiSize,None),name="yPi")
@@ -112,6 +116,7 @@ class dNNTF():
                     costs.append(epochCost)
             
             self._parameters = sess.run(parameters)
+        self._weightVersion += 1
             
     
     def predict(self,x):
@@ -128,6 +133,7 @@ class dNNTF():
         with tf.Session() as sess:
          sess.run(init)
          saver.save(sess,'/tmp/model.ckpt')
+        self._weightVersion += 1
         
     def loadModel(self):
         init = tf.global_variables_initializer()
@@ -135,6 +141,12 @@ class dNNTF():
         with tf.Session() as sess:
          sess.run(init)
          saver.restore(sess,'/tmp/model.ckpt')
+        self._weightVersion += 1
+
+    def weightVersion(self):
+        """ returns a number which changes whenever the weights change
+        """
+        return self._weightVersion
 
 if __name__ == "__main__":
     from tttBoard import tttBoard
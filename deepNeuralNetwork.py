@@ -26,6 +26,10 @@ class dnNetwork():
         x = self._layer2(x)
         self._outputs = self._outLayer(x)
         self._model = keras.Model(inputs=self._inputs,outputs=self._outputs)
+        # bumped by train, saveModel and loadModel. evaluationCache keys the
+        # evaluations by it, so those of older weights are no longer found
+        # and age out of the cache
+        self._weightVersion = 0
         self._model.compile(optimizer=tf.train.AdamOptimizer(0.001),
                       loss=self.loss,
                       metrics=['accuracy'])
@@ -39,20 +43,28 @@ class dnNetwork():
         """ Load the network parameters from a file
         """
         self._model.load_weights('my_model')
+        self._weightVersion += 1
         return None
 
     def saveModel(self):
         """ Save the network parameters to a file
         """
         self._model.save_weights('./my_model')
+        self._weightVersion += 1
         return None
 
     def train(self, train_x,train_y):
         """ Train the network using passed training data as numpy array
         """
         self._model.fit(train_x,train_y,batch_size=1,epochs = 1)
+        self._weightVersion += 1
         return None
     
+    def weightVersion(self):
+        """ returns a number which changes whenever the weights change
+        """
+        return self._weightVersion
+
     def predict(self,x):
         """Predict the output, given input
         """
@@ -0,0 +1,82 @@
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+from __future__ import division
+from collections import OrderedDict
+import numpy as np
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+class evaluationCache:
+    """ least recently used cache of network evaluations, mapping the state
+        of a position to the policy p and value v the network gave it, held
+        to at most maxEntries positions. Evaluations of a network are only
+        good for the weights they were made with, so entries are keyed by
+        the owner of the evaluation, the network and its weightVersion(),
+        which train, saveModel and loadModel bump, as well as by the state.
+        Entries of other networks or older weights are left to age out.
+        Networks without weightVersion are taken to never change. shared()
+        is the cache of the whole process, the one searchers use unless
+        given their own
+    """
+    _shared = None
+
+    def __init__(self, maxEntries=100000):
+        self._maxEntries = maxEntries
+        self._entries = OrderedDict()
+        # number of every network seen, by id. The network is kept alongside
+        # so that its id is not reused by another one
+        self._networks = {}
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def shared(cls):
+        """ returns the cache shared by all searchers of the process """
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __len__(self):
+        return len(self._entries)
+
+    def owner(self, network):
+        """ returns tuple of the number of network and its current
+            weightVersion, to pass to lookup and add
+        """
+        version = network.weightVersion() if hasattr(network, 'weightVersion') else 0
+        number = self._networks.get(id(network))
+        if number is None:
+            number = self._networks[id(network)] = (len(self._networks), network)
+        return number[0], version
+
+    def lookup(self, owner, state):
+        """ returns tuple (p, v) stored for state by owner, counting a hit,
+            otherwise counts a miss and returns None
+        """
+        entry = self._entries.get((owner, state))
+        if entry is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end((owner, state))
+        self._hits += 1
+        return entry
+
+    def add(self, owner, state, p, v):
+        """ stores a copy of policy p and value v of state by owner, dropping
+            the least recently used position if the cache is full
+        """
+        self._entries[(owner, state)] = (np.array(p), float(v))
+        if len(self._entries) > self._maxEntries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """ returns dictionary of entries, networks, hits and misses """
+        return {'entries': len(self), 'networks': len(self._networks),
+                'hits': self._hits, 'misses': self._misses}
+
+    def report(self):
+        """ returns stats as a line of text """
+        stats = self.stats()
+        lookups = max(stats['hits'] + stats['misses'], 1)
+        return ("Evaluations: {entries} cached of {networks} networks, "
+                "{hits} hits ({0:.0f}%), {misses} misses").format(
+                    100*stats['hits'] / lookups, **stats)
@@ -0,0 +1,262 @@
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+from __future__ import division
+import multiprocessing, queue, time
+import numpy as np
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+class inferenceServer:
+    """ process owning the network and evaluating the positions of many
+        search processes together. Each client writes its positions to its
+        own slot of shared memory buffers and sends a request on a queue. The
+        server takes requests till it has maxBatch positions or maxWait
+        seconds have gone since the first one, evaluates them all in one
+        predict call and writes the results back to the slots. makeNetwork
+        is a picklable callable building the network, called in the server
+        process only, so that the model is loaded once. The network takes
+        and returns one column per position, as alphaZeroMCTS uses it, and
+        so do the clients, which can stand in for it
+    """
+    statNames = ('requests', 'positions', 'batches', 'waitSum', 'waitMax',
+                 'busy', 'begin', 'version')
+
+    def __init__(self, makeNetwork, features, moves, clients=1, clientBatch=1,
+                 maxBatch=64, maxWait=0.002):
+        self._makeNetwork = makeNetwork
+        self._features = features
+        self._moves = moves
+        self._clients = clients
+        self._clientBatch = clientBatch
+        self._maxBatch = max(maxBatch, clientBatch)
+        self._maxWait = maxWait
+        # slot of client c is row c of the buffers, room for clientBatch
+        # positions
+        self._inputs = multiprocessing.RawArray('f', clients*clientBatch*features)
+        self._policies = multiprocessing.RawArray('f', clients*clientBatch*moves)
+        self._values = multiprocessing.RawArray('f', clients*clientBatch)
+        # requests are tuples (client, positions, time sent), 'load' to load
+        # the model again or 'stop'. The server answers on the queue of the
+        # client once its results are in the slot
+        self._requests = multiprocessing.Queue()
+        self._responses = [multiprocessing.Queue() for c in range(clients)]
+        # the server acknowledges every 'load' on this queue once done
+        self._loaded = multiprocessing.Queue()
+        # running totals of statNames, written by the server only
+        self._stats = multiprocessing.RawArray('d', len(inferenceServer.statNames))
+        self._process = None
+        self._views = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_process'] = None
+        state['_views'] = None
+        return state
+
+    def views(self):
+        """ returns numpy views of the shared inputs, policies and values,
+            of shapes (clients, clientBatch, features or moves or 1)
+        """
+        if self._views is None:
+            shape = (self._clients, self._clientBatch)
+            self._views = (
+                np.frombuffer(self._inputs, dtype=np.float32).reshape(shape + (self._features,)),
+                np.frombuffer(self._policies, dtype=np.float32).reshape(shape + (self._moves,)),
+                np.frombuffer(self._values, dtype=np.float32).reshape(shape + (1,)))
+        return self._views
+
+    def start(self):
+        """ starts the server process and returns the server """
+        self._process = multiprocessing.Process(target=self.serve)
+        self._process.daemon = True
+        self._process.start()
+        return self
+
+    def stop(self):
+        """ stops the server process once the requests sent are answered """
+        if self._process is not None:
+            self._requests.put('stop')
+            self._process.join()
+            self._process = None
+
+    def loadModel(self):
+        """ has the server load the network parameters again, for instance
+            after training saved new ones, and waits till it has
+        """
+        self._requests.put('load')
+        self._loaded.get()
+
+    def client(self, index):
+        """ returns the inferenceClient of slot index, to be passed to the
+            search process
+        """
+        assert(0 <= index < self._clients)
+        return inferenceClient(self, index)
+
+    def serve(self):
+        """ body of the server process """
+        network = self._makeNetwork()
+        inputs, policies, values = self.views()
+        stats = dict((name, ii) for ii, name in enumerate(inferenceServer.statNames))
+        self._stats[stats['begin']] = time.time()
+        if hasattr(network, 'weightVersion'):
+            self._stats[stats['version']] = network.weightVersion()
+        carry = None
+        while True:
+            request = carry if carry is not None else self._requests.get()
+            carry = None
+            if request == 'stop':
+                break
+            if request == 'load':
+                network.loadModel()
+                # clients see the new version before any result of the new
+                # weights, so that their evaluation caches key them by it
+                if hasattr(network, 'weightVersion'):
+                    self._stats[stats['version']] = network.weightVersion()
+                self._loaded.put(True)
+                continue
+            # gather requests till the batch is full or the deadline passes
+            batch = [request]
+            positions = request[1]
+            deadline = time.perf_counter() + self._maxWait
+            while positions < self._maxBatch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if isinstance(request, str) or positions + request[1] > self._maxBatch:
+                    carry = request
+                    break
+                batch.append(request)
+                positions += request[1]
+            begin = time.time()
+            x = np.concatenate([inputs[c, :count] for c, count, sent in batch])
+            # network takes one column per position
+            p, v = network.predict(x.T)
+            row = 0
+            for c, count, sent in batch:
+                policies[c, :count] = p[:, row:row + count].T
+                values[c, :count, 0] = v[0, row:row + count]
+                row += count
+                self._responses[c].put(True)
+                self._stats[stats['waitSum']] += begin - sent
+                self._stats[stats['waitMax']] = max(self._stats[stats['waitMax']], begin - sent)
+            self._stats[stats['busy']] += time.time() - begin
+            self._stats[stats['requests']] += len(batch)
+            self._stats[stats['positions']] += positions
+            self._stats[stats['batches']] += 1
+
+    def stats(self):
+        """ returns dictionary of requests, positions and batches served,
+            positions per second and per batch, the mean and largest time
+            requests waited in the queue and the fraction of the time spent
+            in the network
+        """
+        totals = dict(zip(inferenceServer.statNames, self._stats))
+        elapsed = time.time() - totals['begin'] if totals['begin'] else 0
+        batches = max(totals['batches'], 1)
+        return {'requests': int(totals['requests']),
+                'positions': int(totals['positions']),
+                'batches': int(totals['batches']),
+                'throughput': totals['positions'] / elapsed if elapsed else 0,
+                'meanBatch': totals['positions'] / batches,
+                'meanWait': totals['waitSum'] / max(totals['requests'], 1),
+                'maxWait': totals['waitMax'],
+                'busy': totals['busy'] / elapsed if elapsed else 0}
+
+    def report(self):
+        """ returns stats as a line of text """
+        stats = self.stats()
+        return ("Inference: {positions} positions in {batches} batches, "
+                "{throughput:.0f} positions/s, {meanBatch:.1f} per batch, "
+                "wait {0:.2f}ms mean {1:.2f}ms max, {2:.0f}% busy").format(
+                    1000*stats['meanWait'], 1000*stats['maxWait'],
+                    100*stats['busy'], **stats)
+
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+class inferenceClient:
+    """ network of a search process, evaluating its positions on an
+        inferenceServer. At most clientBatch positions a call
+    """
+    def __init__(self, server, index):
+        self._server = server
+        self._index = index
+
+    def predict(self, x):
+        """ takes (features, K) array x and returns the policies (moves, K)
+            and values (1, K) of its columns
+        """
+        inputs, policies, values = self._server.views()
+        count = x.shape[1]
+        inputs[self._index, :count] = x.T
+        self._server._requests.put((self._index, count, time.time()))
+        self._server._responses[self._index].get()
+        return (policies[self._index, :count].T.copy(),
+                values[self._index, :count].T.copy())
+
+    def weightVersion(self):
+        """ returns weightVersion of the network of the server, as of its
+            last batch
+        """
+        return int(self._server._stats[inferenceServer.statNames.index('version')])
+
+# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+if __name__ == "__main__":
+    # self-play simulations per second of worker processes each calling its
+    # own network against all of them sharing one server. The stand-in
+    # network is a small numpy net which, like a keras predict call, spends
+    # a fixed time of CPU per call whatever the number of positions
+    from tttBoard import tttBoard
+    from alphaZeroMCTS import alphaZeroMCTS
+    class overheadNetwork:
+        def __init__(self, boardSize=9, overhead=0.002, hidden=64):
+            self._overhead = overhead
+            self._W1 = np.random.randn(hidden, 2*boardSize + 1)*0.1
+            self._Wp = np.random.randn(boardSize, hidden)*0.1
+            self._Wv = np.random.randn(1, hidden)*0.1
+        def predict(self, x):
+            end = time.perf_counter() + self._overhead
+            while time.perf_counter() < end:
+                pass
+            h = np.maximum(self._W1.dot(x), 0)
+            p = np.exp(self._Wp.dot(h))
+            return p / p.sum(axis=0), np.tanh(self._Wv.dot(h))
+    def selfPlay(network, batchSize, seconds, simulations):
+        searcher = alphaZeroMCTS(tttBoard(3), network, batchSize=batchSize,
+                                 evalCache=None)
+        searcher._maxMoves = 9
+        begin = time.perf_counter()
+        count = 0
+        while time.perf_counter() - begin < seconds:
+            if batchSize > 1:
+                count += searcher.runBatch(batchSize)
+            else:
+                searcher.runSimulation()
+                count += 1
+        simulations.value = count
+    workers, seconds = 8, 2
+    for batchSize in (1, 8):
+        for shared in (False, True):
+            if shared:
+                server = inferenceServer(overheadNetwork, 19, 9, clients=workers,
+                                         clientBatch=batchSize).start()
+                networks = [server.client(ii) for ii in range(workers)]
+            else:
+                networks = [overheadNetwork() for ii in range(workers)]
+            counts = [multiprocessing.Value('l', 0) for ii in range(workers)]
+            processes = [multiprocessing.Process(target=selfPlay, args=(
+                networks[ii], batchSize, seconds, counts[ii])) for ii in range(workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            print("{0} workers, batchSize {1}, {2}: {3:.0f} simulations/s".format(
+                workers, batchSize, "shared server" if shared else "own network",
+                sum(count.value for count in counts) / seconds))
+            if shared:
+                print(server.report())
+                server.stop()
@@ -32,7 +32,7 @@ while len(board.legalMoves()) > 0 and not(gameOver(board)):
     if gameOver(board):
         break
     print('Thinking...')
-#    alphaZeroPredict = alphaZero.predict(board.decodeStateCNN(board._stateHistory))
+#    alphaZeroPredict = alphaZero.predict(board.decodeStateCNN(board.stateHistory()))
     s = np.zeros((1,19))
     s[0,:] = board.decodeState(board.getState())
     alphaZeroPredict = alphaZero.predict(s)